@@ -49,7 +49,8 @@ const startCleanJob = async (source = 'manual') => {
       delete_originals: settings.deleteOriginals,
       upload_enabled: settings.uploadEnabled,
       upload_url: settings.uploadApiUrl,
-      delete_cleaned: settings.deleteCleanedAfterUpload
+      delete_cleaned: settings.deleteCleanedAfterUpload,
+      priority: source === 'manual' ? 'interactive' : 'bulk'
     })
   });
 
@@ -1,15 +1,46 @@
+import asyncio
+import io
+import json
 import os
 import threading
+import time
 import uuid
-from pathlib import Path
-from typing import Optional
+from pathlib import Path, PurePosixPath
+from typing import Literal, Optional
+from urllib.parse import urlsplit, urlunsplit
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from PIL import Image
 
-from uploader import handle_upload, upload_file
+import profiling
+import tracing
+from archive_stream import (
+    ARCHIVE_MEDIA_TYPES,
+    ARCHIVE_WRITERS,
+    DEFAULT_MAX_MEMBER_BYTES,
+    ArchiveError,
+    ChunkReader,
+    QueueWriter,
+    is_image_member,
+    iter_archive_members,
+)
+from leases import CLAIMED, DEFAULT_LEASE_POLL, DONE, create_lease_manager
+from job_store import FILE_CLEANED, FILE_FAILED, FILE_SKIPPED, FILE_UPLOAD_FAILED, FILE_UPLOADED, create_job_store
+from scheduler import PRIORITY_BULK, PriorityGate
+from tracing import span
+from upload_queue import DEFAULT_RETRY_POLL, create_upload_queue
+from uploader import (
+    DEFAULT_BATCH_MAX_BYTES,
+    batch_items,
+    handle_upload,
+    handle_upload_batch,
+    upload_buffers,
+    upload_bytes,
+    upload_file,
+)
 
 ALPHA_THRESHOLD = 0.002
 MAX_ALPHA = 0.99
@@ -37,12 +68,17 @@ class CleanRequest(BaseModel):
     upload_enabled: bool = False
     upload_url: Optional[str] = None
     delete_cleaned: bool = False
+    priority: Literal["interactive", "bulk"] = PRIORITY_BULK
+    upload_batch_size: int = Field(default=1, ge=1, le=100)
+    trace: bool = False
+    profile: bool = False
 
 
 class CleanResponse(BaseModel):
     total: int
     success: int
     failed: int
+    skipped: int = 0
     output_dir: str
     upload_total: int = 0
     upload_success: int = 0
@@ -59,13 +95,56 @@ class CleanStatusResponse(BaseModel):
     total: int
     success: int
     failed: int
+    skipped: int = 0
     upload_total: int = 0
     upload_success: int = 0
     upload_failed: int = 0
+    work_total: int = 0
+    work_remaining: int = 0
     done: bool
+    cancelled: bool = False
     error: Optional[str] = None
 
 
+class CleanCancelRequest(BaseModel):
+    job_id: str
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse that does not listen for disconnects on ``receive``.
+
+    The body iterator keeps reading the request body while the response streams,
+    so ``receive`` must be left to it.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+class UploadQueueEntry(BaseModel):
+    id: int
+    upload_url: str
+    path: str
+    job_id: Optional[str] = None
+    delete_after: bool
+    attempts: int
+    next_attempt: float
+    last_error: Optional[str] = None
+    exhausted: bool
+
+
+class UploadQueueResponse(BaseModel):
+    pending: int
+    exhausted: int
+    entries: list[UploadQueueEntry] = []
+
+
+class UploadQueueFlushResponse(BaseModel):
+    scheduled: int
+    pending: int
+    exhausted: int
+
+
 class UploadTestRequest(BaseModel):
     upload_url: str
 
@@ -77,9 +156,25 @@ class UploadTestResponse(BaseModel):
 
 ALPHA_48 = None
 ALPHA_96 = None
-
-JOBS: dict[str, dict] = {}
-JOBS_LOCK = threading.Lock()
+BLEND_LUTS_48 = None
+BLEND_LUTS_96 = None
+
+JOB_STORE = create_job_store(BASE_DIR)
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", "5"))
+PRIORITY_GATE = PriorityGate()
+TRACE_DIR = os.environ.get("TRACE_DIR")
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", profiling.DEFAULT_INTERVAL))
+LEASES = create_lease_manager(BASE_DIR)
+LEASE_POLL_SECONDS = float(os.environ.get("LEASE_POLL", DEFAULT_LEASE_POLL))
+LEASE_PRUNE_INTERVAL = 3600.0
+UPLOAD_BATCH_MAX_BYTES = int(os.environ.get("UPLOAD_BATCH_MAX_BYTES", DEFAULT_BATCH_MAX_BYTES))
+UPLOAD_QUEUE = create_upload_queue(BASE_DIR)
+UPLOAD_RETRY_POLL_SECONDS = float(os.environ.get("UPLOAD_RETRY_POLL", DEFAULT_RETRY_POLL))
+# Set to make the background drainer retry due uploads now instead of at its next poll.
+UPLOAD_QUEUE_WAKE = threading.Event()
+ARCHIVE_REPORT_NAME = "_clean_report.json"
+ARCHIVE_MAX_MEMBER_BYTES = int(os.environ.get("ARCHIVE_MAX_MEMBER_BYTES", DEFAULT_MAX_MEMBER_BYTES))
 
 
 def load_alpha_map(bg_path: Path):
@@ -98,7 +193,33 @@ def detect_config(width: int, height: int):
     return {"size": 48, "margin_right": 32, "margin_bottom": 32}
 
 
-def remove_watermark(image: Image.Image, alpha_map, wm_size, pos_x, pos_y):
+def build_blend_luts(alpha_map):
+    """Precompute the reverse alpha blend for every watermark pixel.
+
+    Returns one entry per pixel of ``alpha_map``: None where the alpha is below
+    ``ALPHA_THRESHOLD``, otherwise a 256-byte table mapping a blended channel value to
+    the original one. Pixels with the same alpha share one immutable table.
+    """
+    tables: dict[float, bytes] = {}
+    luts = []
+    for alpha in alpha_map:
+        if alpha < ALPHA_THRESHOLD:
+            luts.append(None)
+            continue
+        table = tables.get(alpha)
+        if table is None:
+            clamped = min(alpha, MAX_ALPHA)
+            one_minus = 1.0 - clamped
+            table = bytes(
+                int(max(0, min(255, round((c - clamped * LOGO_VALUE) / one_minus))))
+                for c in range(256)
+            )
+            tables[alpha] = table
+        luts.append(table)
+    return luts
+
+
+def remove_watermark(image: Image.Image, blend_luts, wm_size, pos_x, pos_y):
     pixels = image.load()
     width, height = image.size
 
@@ -109,17 +230,12 @@ def remove_watermark(image: Image.Image, alpha_map, wm_size, pos_x, pos_y):
             if x < 0 or y < 0 or x >= width or y >= height:
                 continue
 
-            alpha = alpha_map[row * wm_size + col]
-            if alpha < ALPHA_THRESHOLD:
+            table = blend_luts[row * wm_size + col]
+            if table is None:
                 continue
 
-            alpha = min(alpha, MAX_ALPHA)
-            one_minus = 1.0 - alpha
             r, g, b, a = pixels[x, y]
-            r = int(max(0, min(255, round((r - alpha * LOGO_VALUE) / one_minus))))
-            g = int(max(0, min(255, round((g - alpha * LOGO_VALUE) / one_minus))))
-            b = int(max(0, min(255, round((b - alpha * LOGO_VALUE) / one_minus))))
-            pixels[x, y] = (r, g, b, a)
+            pixels[x, y] = (table[r], table[g], table[b], a)
 
     return image
 
@@ -148,159 +264,648 @@ def ensure_input_dir(input_dir: Path):
     input_dir.mkdir(parents=True, exist_ok=True)
 
 
-def process_file(path: Path, output_dir: Path, delete_originals: bool):
-    try:
-        img = Image.open(path).convert("RGBA")
-    except Exception as exc:
-        return False, f"open failed: {exc}"
-
-    width, height = img.size
+def watermark_position(width: int, height: int):
     config = detect_config(width, height)
     wm_size = config["size"]
     pos_x = width - config["margin_right"] - wm_size
     pos_y = height - config["margin_bottom"] - wm_size
-
     if pos_x < 0 or pos_y < 0:
+        return None
+    return wm_size, pos_x, pos_y
+
+
+def scan_image(path: Path):
+    """Read only the image header and return ``(cost, reason)``.
+
+    ``cost`` is the pixel count, which drives decode, kernel and encode time.
+    ``reason`` is set when the file can be rejected without decoding it. Unreadable
+    headers are left to ``process_file`` to report.
+    """
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        return 0, None
+    if not watermark_position(width, height):
+        return 0, "image too small"
+    return width * height, None
+
+
+def plan_images(images):
+    """Pre-scan headers and order the work largest first.
+
+    Returns ``(scheduled, rejected, costs)`` where ``rejected`` holds ``(path, reason)``
+    pairs and ``costs`` maps each scheduled path to its estimated cost.
+    """
+    costs = {}
+    rejected = []
+    for path in images:
+        cost, reason = scan_image(path)
+        if reason:
+            rejected.append((path, reason))
+        else:
+            costs[path] = cost
+    scheduled = sorted(costs, key=costs.get, reverse=True)
+    return scheduled, rejected, costs
+
+
+def schedule_job_images(job_id: str, images, progress: dict):
+    """Pre-scan a job's images in its own thread and record what the scan found.
+
+    Rejected images are marked failed, and ``work_total`` (unless resuming, where it is
+    already set) and ``work_remaining`` become known. Returns ``(scheduled, costs)``.
+    """
+    scheduled, rejected, costs = plan_images(images)
+    for path, _ in rejected:
+        JOB_STORE.mark_file(job_id, str(path), FILE_FAILED)
+    progress["failed"] = progress.get("failed", 0) + len(rejected)
+    work_remaining = sum(costs.values())
+    updates = {"failed": progress["failed"], "work_remaining": work_remaining}
+    if "work_total" not in progress:
+        updates["work_total"] = work_remaining
+    update_job(job_id, **updates)
+    return scheduled, costs
+
+
+def clean_image(path: Path):
+    try:
+        with span("decode"):
+            img = Image.open(path).convert("RGBA")
+    except Exception as exc:
+        return False, f"open failed: {exc}"
+
+    position = watermark_position(*img.size)
+    if not position:
         return False, "image too small"
 
-    alpha_map = ALPHA_96 if wm_size == 96 else ALPHA_48
-    remove_watermark(img, alpha_map, wm_size, pos_x, pos_y)
+    wm_size, pos_x, pos_y = position
+    blend_luts = BLEND_LUTS_96 if wm_size == 96 else BLEND_LUTS_48
+    with span("kernel", size=wm_size):
+        remove_watermark(img, blend_luts, wm_size, pos_x, pos_y)
+    return True, img
+
+
+def encode_png(img: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    with span("encode"):
+        img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def write_atomic(path: Path, data: bytes):
+    # Readers (and peers sharing the volume) never see a half-written output.
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def file_size(path) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def delete_original(path: Path):
+    try:
+        path.unlink()
+    except Exception:
+        pass
+
+
+def process_file(path: Path, output_dir: Path, delete_originals: bool):
+    ok, img = clean_image(path)
+    if not ok:
+        return False, img
 
     output_dir.mkdir(parents=True, exist_ok=True)
     out_name = path.stem + "_clean.png"
     out_path = output_dir / out_name
 
     try:
-        img.save(out_path, format="PNG")
+        data = encode_png(img)
+        with span("write", bytes=len(data)):
+            write_atomic(out_path, data)
     except Exception as exc:
         return False, f"save failed: {exc}"
 
     if delete_originals:
-        try:
-            path.unlink()
-        except Exception:
-            pass
+        delete_original(path)
 
     return True, str(out_path)
 
 
-def init_job(job_id: str, total: int):
-    with JOBS_LOCK:
-        JOBS[job_id] = {
-            "job_id": job_id,
-            "total": total,
-            "success": 0,
-            "failed": 0,
-            "upload_total": 0,
-            "upload_success": 0,
-            "upload_failed": 0,
-            "done": False,
-            "error": None,
-        }
+def encode_clean_file(path: Path):
+    ok, img = clean_image(path)
+    if not ok:
+        return False, img
+    try:
+        return True, encode_png(img)
+    except Exception as exc:
+        return False, f"save failed: {exc}"
+
+
+def finish_inline_upload(path: Path, output_dir: Path, data: bytes, upload_ok: bool, upload_result, delete_originals: bool):
+    """Settle an in-memory upload: on failure write the PNG to ``output_dir`` so it can be retried."""
+    if upload_ok:
+        if delete_originals:
+            delete_original(path)
+        return True, upload_result
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out_path = output_dir / (path.stem + "_clean.png")
+    try:
+        with span("write", bytes=len(data)):
+            write_atomic(out_path, data)
+    except Exception as exc:
+        return False, f"save failed: {exc}"
+
+    if delete_originals:
+        delete_original(path)
+    return True, str(out_path)
+
+
+def process_file_upload(path: Path, output_dir: Path, upload_url: str, delete_originals: bool):
+    """Clean ``path`` and upload the PNG straight from memory.
+
+    Returns ``(ok, result, upload_ok, upload_result)``. The cleaned file is written to
+    ``output_dir`` only when the upload fails, so it can be retried later.
+    """
+    ok, data = encode_clean_file(path)
+    if not ok:
+        return False, data, False, None
+
+    upload_ok, upload_result = upload_bytes(upload_url, data, path.stem + "_clean.png")
+    ok, result = finish_inline_upload(path, output_dir, data, upload_ok, upload_result, delete_originals)
+    return ok, result, upload_ok and ok, upload_result
+
+
+def init_job(job_id: str, total: int, meta: Optional[dict] = None, files=None):
+    JOB_STORE.init_job(job_id, total, meta=meta, files=files)
 
 
 def update_job(job_id: str, **updates):
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return
-        job.update(updates)
+    JOB_STORE.update_job(job_id, **updates)
 
 
 def get_job(job_id: str):
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return None
-        return dict(job)
-
-
-def run_clean_loop(images, output_dir: Path, request: CleanRequest, job_id: Optional[str] = None):
-    total = len(images)
-    success = 0
-    failed = 0
-    upload_total = 0
-    upload_success = 0
-    upload_failed = 0
-    uploaded_urls: list[str] = []
-    cleaned_paths: list[str] = []
+    return JOB_STORE.get_job(job_id)
+
+
+def is_cancelled(job_id: Optional[str]) -> bool:
+    return bool(job_id) and JOB_STORE.is_cancelled(job_id)
+
+
+def job_meta(output_dir: Path, request: CleanRequest) -> dict:
+    return {"output_dir": str(output_dir), "request": request.model_dump()}
+
+
+def queue_failed_upload(job_id: Optional[str], path: str, request: CleanRequest, error):
+    """Keep a cleaned file whose upload failed in the retry queue, so it is retried without re-cleaning."""
+    if UPLOAD_QUEUE:
+        UPLOAD_QUEUE.add(request.upload_url, path, request.delete_cleaned, job_id=job_id, error=str(error))
+
 
-    for image_path in images:
-        ok, result = process_file(image_path, output_dir, request.delete_originals)
+def lease_scope(output_dir: Path, request: CleanRequest) -> str:
+    """Output settings a done marker is valid for: the output dir and the upload target."""
+    upload_url = (request.upload_url or "") if request.upload_enabled else ""
+    return f"{Path(output_dir).resolve()}\n{upload_url}"
+
+
+def claim_images(images, scope, on_skip, should_stop):
+    """Yield the images this instance should clean.
+
+    Without worker coordination every image is yielded. In lease mode only images this
+    instance claims under ``scope`` are yielded; images a peer already finished with the
+    same output settings go to ``on_skip``, and images a peer is working on are retried
+    until they are finished or their lease expires, so files of a crashed peer are
+    picked up.
+    """
+    if not LEASES:
+        yield from images
+        return
+    pending = list(images)
+    while pending:
+        deferred = []
+        for path in pending:
+            if should_stop():
+                return
+            state = LEASES.claim(path, scope)
+            if state == CLAIMED:
+                yield path
+            elif state == DONE:
+                on_skip(path)
+            else:
+                deferred.append(path)
+        pending = deferred
+        if pending:
+            time.sleep(LEASE_POLL_SECONDS)
+
+
+def run_clean_loop(
+    images,
+    output_dir: Path,
+    request: CleanRequest,
+    job_id: Optional[str] = None,
+    progress: Optional[dict] = None,
+    costs: Optional[dict] = None,
+):
+    progress = progress or {}
+    costs = costs or {}
+    total = progress.get("total", len(images))
+    success = progress.get("success", 0)
+    failed = progress.get("failed", 0)
+    skipped = progress.get("skipped", 0)
+    upload_success = progress.get("upload_success", 0)
+    upload_failed = progress.get("upload_failed", 0)
+    upload_total = upload_success + upload_failed
+    work_remaining = sum(costs.get(path, 0) for path in images)
+    uploaded_urls: list[str] = []
+    cleaned_paths: list[str] = list(progress.get("cleaned_paths", []))
+    cancelled = False
+    # Upload-only output: nobody keeps the cleaned file, so upload it from memory right
+    # after cleaning instead of writing, re-reading and deleting it.
+    upload_inline = bool(request.upload_enabled and request.upload_url and request.delete_cleaned)
+    batch_size = max(1, request.upload_batch_size)
+    upload_batch: list[tuple[Path, bytes]] = []
+    upload_batch_bytes = 0
+    scope = lease_scope(output_dir, request) if LEASES else ""
+
+    def skip_image(image_path):
+        nonlocal skipped, work_remaining
+        skipped += 1
+        work_remaining -= costs.get(image_path, 0)
+        if job_id:
+            JOB_STORE.mark_file(job_id, str(image_path), FILE_SKIPPED)
+            update_job(job_id, skipped=skipped, work_remaining=work_remaining)
+
+    def record_file(image_path, ok, result, file_state):
+        nonlocal success, failed, work_remaining
+        if LEASES:
+            if ok:
+                LEASES.complete(image_path, scope)
+            else:
+                LEASES.release(image_path, scope)
         if ok:
             success += 1
-            cleaned_paths.append(result)
         else:
             failed += 1
+        work_remaining -= costs.get(image_path, 0)
 
         if job_id:
-            update_job(
-                job_id,
-                success=success,
-                failed=failed,
-                upload_total=upload_total,
-                upload_success=upload_success,
-                upload_failed=upload_failed,
-            )
-
-    if request.upload_enabled and request.upload_url and cleaned_paths:
-        upload_total = len(cleaned_paths)
-        if job_id:
-            update_job(job_id, upload_total=upload_total)
+            with span("job_update"):
+                JOB_STORE.mark_file(job_id, str(image_path), file_state, result if ok else None)
+                update_job(
+                    job_id,
+                    success=success,
+                    failed=failed,
+                    work_remaining=work_remaining,
+                    upload_total=upload_total,
+                    upload_success=upload_success,
+                    upload_failed=upload_failed,
+                )
 
-        for cleaned_path in cleaned_paths:
-            upload_ok, upload_result, _ = handle_upload(
-                request.upload_url,
-                cleaned_path,
-                request.delete_cleaned,
-            )
+    def record_inline_upload(image_path, ok, result, upload_ok, upload_result):
+        nonlocal upload_total, upload_success, upload_failed
+        if ok:
+            upload_total += 1
             if upload_ok:
                 upload_success += 1
                 uploaded_urls.append(upload_result)
             else:
                 upload_failed += 1
+                queue_failed_upload(job_id, result, request, upload_result)
+        file_state = (FILE_UPLOADED if upload_ok else FILE_UPLOAD_FAILED) if ok else FILE_FAILED
+        record_file(image_path, ok, result, file_state)
 
-            if job_id:
-                update_job(
-                    job_id,
-                    upload_total=upload_total,
-                    upload_success=upload_success,
-                    upload_failed=upload_failed,
+    def flush_upload_batch():
+        nonlocal upload_batch_bytes
+        if not upload_batch:
+            return
+        buffers = [(image_path.stem + "_clean.png", data) for image_path, data in upload_batch]
+        results = upload_buffers(request.upload_url, buffers)
+        for (image_path, data), (upload_ok, upload_result) in zip(upload_batch, results):
+            ok, result = finish_inline_upload(
+                image_path,
+                output_dir,
+                data,
+                upload_ok,
+                upload_result,
+                request.delete_originals,
+            )
+            record_inline_upload(image_path, ok, result, upload_ok and ok, upload_result)
+        upload_batch.clear()
+        upload_batch_bytes = 0
+
+    for image_path in claim_images(images, scope, skip_image, lambda: is_cancelled(job_id)):
+        with span("priority_wait"):
+            PRIORITY_GATE.wait_turn(request.priority, lambda: is_cancelled(job_id))
+        if is_cancelled(job_id):
+            cancelled = True
+            break
+        with span("file", file=image_path.name):
+            if upload_inline and batch_size > 1:
+                ok, data = encode_clean_file(image_path)
+                if not ok:
+                    record_file(image_path, False, data, FILE_FAILED)
+                    continue
+                if upload_batch and (
+                    len(upload_batch) >= batch_size or upload_batch_bytes + len(data) > UPLOAD_BATCH_MAX_BYTES
+                ):
+                    flush_upload_batch()
+                upload_batch.append((image_path, data))
+                upload_batch_bytes += len(data)
+                continue
+            if upload_inline:
+                ok, result, upload_ok, upload_result = process_file_upload(
+                    image_path,
+                    output_dir,
+                    request.upload_url,
+                    request.delete_originals,
                 )
+                record_inline_upload(image_path, ok, result, upload_ok, upload_result)
+                continue
+            ok, result = process_file(image_path, output_dir, request.delete_originals)
+            if ok:
+                cleaned_paths.append(result)
+            record_file(image_path, ok, result, FILE_CLEANED if ok else FILE_FAILED)
+
+    # Images already cleaned into memory are uploaded even after a cancel, so the work is not lost.
+    flush_upload_batch()
+
+    if request.upload_enabled and request.upload_url and cleaned_paths and not cancelled:
+        upload_total = upload_success + upload_failed + len(cleaned_paths)
+        if job_id:
+            update_job(job_id, upload_total=upload_total)
+
+        batches = batch_items(cleaned_paths, batch_size, UPLOAD_BATCH_MAX_BYTES, file_size)
+        for batch in batches:
+            with span("priority_wait"):
+                PRIORITY_GATE.wait_turn(request.priority, lambda: is_cancelled(job_id))
+            if is_cancelled(job_id):
+                cancelled = True
+                break
+            if len(batch) == 1:
+                with span("file", file=os.path.basename(batch[0])):
+                    results = [handle_upload(request.upload_url, batch[0], request.delete_cleaned)]
+            else:
+                results = handle_upload_batch(request.upload_url, batch, request.delete_cleaned)
+
+            for cleaned_path, (upload_ok, upload_result, _) in zip(batch, results):
+                if upload_ok:
+                    upload_success += 1
+                    uploaded_urls.append(upload_result)
+                else:
+                    upload_failed += 1
+                    queue_failed_upload(job_id, cleaned_path, request, upload_result)
+                if job_id:
+                    JOB_STORE.mark_file_output(job_id, cleaned_path, FILE_UPLOADED if upload_ok else FILE_UPLOAD_FAILED)
+
+            if job_id:
+                with span("job_update"):
+                    update_job(
+                        job_id,
+                        upload_total=upload_total,
+                        upload_success=upload_success,
+                        upload_failed=upload_failed,
+                    )
 
     return {
         "total": total,
         "success": success,
         "failed": failed,
+        "skipped": skipped,
         "upload_total": upload_total,
         "upload_success": upload_success,
         "upload_failed": upload_failed,
         "uploaded_urls": uploaded_urls,
+        "cancelled": cancelled,
     }
 
 
-def run_clean_job(job_id: str, images, output_dir: Path, request: CleanRequest):
+def clean_archive_stream(reader: ChunkReader, writer: QueueWriter, output_format: str):
+    """Clean every image member read from ``reader`` and write the results to ``writer``.
+
+    Members are handled one at a time, so only the current image is held in memory. A
+    ``_clean_report.json`` member with the counters and per-file errors ends the archive.
+    """
+    report = {"total": 0, "success": 0, "failed": 0, "errors": {}}
+    archive = None
     try:
-        result = run_clean_loop(images, output_dir, request, job_id=job_id)
-        update_job(
-            job_id,
-            success=result["success"],
-            failed=result["failed"],
-            upload_total=result["upload_total"],
-            upload_success=result["upload_success"],
-            upload_failed=result["upload_failed"],
-            done=True,
-        )
+        archive = ARCHIVE_WRITERS[output_format](writer)
+        for name, data in iter_archive_members(reader, ARCHIVE_MAX_MEMBER_BYTES):
+            if not is_image_member(name):
+                continue
+            report["total"] += 1
+            if data is None:
+                report["failed"] += 1
+                report["errors"][name] = f"member larger than {ARCHIVE_MAX_MEMBER_BYTES} bytes"
+                continue
+            PRIORITY_GATE.wait_turn(PRIORITY_BULK)
+            ok, img = clean_image(io.BytesIO(data))
+            if ok:
+                member = PurePosixPath(name)
+                try:
+                    archive.add(str(member.with_name(member.stem + "_clean.png")), encode_png(img))
+                    report["success"] += 1
+                    continue
+                except ArchiveError:
+                    raise
+                except Exception as exc:
+                    img = f"save failed: {exc}"
+            report["failed"] += 1
+            report["errors"][name] = img
+        archive.add(ARCHIVE_REPORT_NAME, json.dumps(report, indent=2).encode())
+        archive.close()
+    except Exception as exc:
+        report["error"] = str(exc)
+        try:
+            if archive:
+                archive.add(ARCHIVE_REPORT_NAME, json.dumps(report, indent=2).encode())
+                archive.close()
+        except Exception:
+            pass
+    finally:
+        try:
+            writer.close()
+        except ArchiveError:
+            pass
+        reader.drain()
+
+
+def trace_path(job_id: str) -> Path:
+    return Path(TRACE_DIR or BASE_DIR / ".gemini-clean" / "traces") / f"{job_id}.json"
+
+
+def profile_dir() -> Path:
+    return Path(PROFILE_DIR or BASE_DIR / ".gemini-clean" / "profiles")
+
+
+def run_clean_job(
+    job_id: str,
+    images,
+    output_dir: Path,
+    request: CleanRequest,
+    progress: Optional[dict] = None,
+):
+    """Clean ``images`` for a started job. The images are pre-scanned and ordered here,
+    so starting a job never waits on file headers."""
+    tracer = tracing.Tracer(f"clean job {job_id}") if request.trace else None
+    tracing.activate(tracer)
+    profiler = profiling.JobProfiler(threading.get_ident(), PROFILE_INTERVAL) if request.profile else None
+    if profiler:
+        profiler.start()
+    PRIORITY_GATE.register(request.priority)
+    try:
+        progress = dict(progress or {})
+        with span("prescan", files=len(images)):
+            images, costs = schedule_job_images(job_id, images, progress)
+        result = run_clean_loop(images, output_dir, request, job_id=job_id, progress=progress, costs=costs)
+        final = {
+            "success": result["success"],
+            "failed": result["failed"],
+            "skipped": result["skipped"],
+            "upload_total": result["upload_total"],
+            "upload_success": result["upload_success"],
+            "upload_failed": result["upload_failed"],
+            "cancelled": result["cancelled"],
+        }
     except Exception as exc:
-        update_job(job_id, error=str(exc), done=True)
+        final = {"error": str(exc)}
+    finally:
+        PRIORITY_GATE.unregister(request.priority)
+        if LEASES:
+            LEASES.release_held()
+        tracing.deactivate()
+        # Saved before the job is marked done, so a client polling for done can fetch them.
+        if tracer:
+            try:
+                tracer.save(trace_path(job_id))
+            except Exception:
+                pass
+        if profiler:
+            profiler.stop()
+            try:
+                profiler.save(profile_dir(), job_id)
+            except Exception:
+                pass
+    update_job(job_id, done=True, **final)
+
+
+def resume_interrupted_jobs():
+    resumed = []
+    for job in JOB_STORE.orphaned_jobs():
+        job_id = job["job_id"]
+        meta = job.get("meta") or {}
+        if "request" not in meta or not JOB_STORE.claim_job(job_id):
+            continue
+        request = CleanRequest(**meta["request"])
+        output_dir = Path(meta["output_dir"])
+        to_clean, to_upload = JOB_STORE.pending_files(job_id)
+        images = [Path(p) for p in to_clean]
+        progress = {
+            "total": job["total"],
+            "success": job["success"],
+            "failed": job["failed"],
+            "skipped": job.get("skipped", 0),
+            "upload_success": job["upload_success"],
+            "upload_failed": job["upload_failed"],
+            "work_total": job.get("work_total", 0),
+            "cleaned_paths": to_upload,
+        }
+        # Pre-scanned again in the job thread, which restores largest-first order.
+        thread = threading.Thread(
+            target=run_clean_job,
+            args=(job_id, images, output_dir, request, progress),
+            daemon=True,
+        )
+        thread.start()
+        resumed.append(job_id)
+    return resumed
+
+
+def job_store_maintenance():
+    last_prune = 0.0
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            JOB_STORE.heartbeat()
+            if LEASES:
+                LEASES.renew()
+                if time.monotonic() - last_prune >= LEASE_PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    LEASES.prune()
+            resume_interrupted_jobs()
+        except Exception:
+            pass
+
+
+def drain_upload_queue() -> dict:
+    """Retry every queued upload that is due. Files that disappeared are dropped from the queue."""
+    result = {"uploaded": 0, "failed": 0, "missing": 0}
+    if not UPLOAD_QUEUE:
+        return result
+    while True:
+        entries = UPLOAD_QUEUE.claim_due()
+        if not entries:
+            return result
+        for entry in entries:
+            path = entry["path"]
+            if not os.path.exists(path):
+                UPLOAD_QUEUE.discard(entry["id"])
+                result["missing"] += 1
+                continue
+            with span("upload_retry", file=os.path.basename(path)):
+                upload_ok, upload_result, _ = handle_upload(entry["upload_url"], path, entry["delete_after"])
+            if upload_ok:
+                UPLOAD_QUEUE.succeeded(entry["id"])
+                if entry["job_id"]:
+                    JOB_STORE.mark_file_output(entry["job_id"], path, FILE_UPLOADED)
+                result["uploaded"] += 1
+            else:
+                UPLOAD_QUEUE.failed(entry, str(upload_result))
+                result["failed"] += 1
+
+
+def upload_queue_drainer():
+    while True:
+        UPLOAD_QUEUE_WAKE.wait(UPLOAD_RETRY_POLL_SECONDS)
+        UPLOAD_QUEUE_WAKE.clear()
+        try:
+            drain_upload_queue()
+        except Exception:
+            pass
 
 
 @app.on_event("startup")
 def load_assets():
-    global ALPHA_48, ALPHA_96
+    global ALPHA_48, ALPHA_96, BLEND_LUTS_48, BLEND_LUTS_96
     assets_dir = Path(__file__).resolve().parent / "assets"
     ALPHA_48 = load_alpha_map(assets_dir / "bg_48.png")
     ALPHA_96 = load_alpha_map(assets_dir / "bg_96.png")
+    BLEND_LUTS_48 = build_blend_luts(ALPHA_48)
+    BLEND_LUTS_96 = build_blend_luts(ALPHA_96)
+
+
+@app.on_event("startup")
+def start_job_store():
+    resume_interrupted_jobs()
+    threading.Thread(target=job_store_maintenance, daemon=True).start()
+
+
+@app.on_event("startup")
+def start_upload_queue():
+    if UPLOAD_QUEUE:
+        threading.Thread(target=upload_queue_drainer, daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_job_store():
+    JOB_STORE.flush()
 
 
 @app.get("/health")
@@ -321,12 +926,21 @@ def clean_images(request: CleanRequest):
     ensure_input_dir(input_dir)
 
     images = list(iter_images(input_dir))
-    result = run_clean_loop(images, output_dir, request)
+    scheduled, rejected, costs = plan_images(images)
+    progress = {"total": len(images), "failed": len(rejected)}
+    PRIORITY_GATE.register(request.priority)
+    try:
+        result = run_clean_loop(scheduled, output_dir, request, progress=progress, costs=costs)
+    finally:
+        PRIORITY_GATE.unregister(request.priority)
+        if LEASES:
+            LEASES.release_held()
 
     return CleanResponse(
         total=result["total"],
         success=result["success"],
         failed=result["failed"],
+        skipped=result["skipped"],
         output_dir=str(output_dir),
         upload_total=result["upload_total"],
         upload_success=result["upload_success"],
@@ -349,15 +963,16 @@ def clean_start(request: CleanRequest):
 
     images = list(iter_images(input_dir))
     job_id = uuid.uuid4().hex
-    init_job(job_id, len(images))
+    init_job(job_id, len(images), meta=job_meta(output_dir, request), files=images)
 
     if not images:
         update_job(job_id, done=True)
         return CleanStartResponse(job_id=job_id)
 
+    progress = {"total": len(images)}
     thread = threading.Thread(
         target=run_clean_job,
-        args=(job_id, images, output_dir, request),
+        args=(job_id, images, output_dir, request, progress),
         daemon=True,
     )
     thread.start()
@@ -374,14 +989,124 @@ def clean_status(job_id: str):
         total=job["total"],
         success=job["success"],
         failed=job["failed"],
+        skipped=job.get("skipped", 0),
         upload_total=job["upload_total"],
         upload_success=job["upload_success"],
         upload_failed=job["upload_failed"],
+        work_total=job.get("work_total", 0),
+        work_remaining=job.get("work_remaining", 0),
         done=job["done"],
+        cancelled=job.get("cancelled", False),
         error=job["error"],
     )
 
 
+@app.post("/clean/cancel", response_model=CleanStatusResponse)
+def clean_cancel(request: CleanCancelRequest):
+    if not JOB_STORE.request_cancel(request.job_id):
+        raise HTTPException(status_code=404, detail="job not found")
+    return clean_status(request.job_id)
+
+
+@app.post("/clean/archive")
+async def clean_archive(request: Request, output_format: Literal["tar", "zip"] = "tar"):
+    # Both directions hand chunks over without parking a threadpool thread, so archive
+    # streams do not starve the sync endpoints.
+    loop = asyncio.get_running_loop()
+    reader = ChunkReader(loop=loop)
+    writer = QueueWriter(loop=loop)
+
+    async def pump_request_body():
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    await reader.feed_async(chunk)
+        finally:
+            await reader.close_feed_async()
+
+    async def stream_archive():
+        pump = asyncio.create_task(pump_request_body())
+        worker = threading.Thread(
+            target=clean_archive_stream,
+            args=(reader, writer, output_format),
+            daemon=True,
+        )
+        worker.start()
+        try:
+            while True:
+                chunk = await writer.queue.get_async()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            writer.abandon()
+            await pump
+
+    return DuplexStreamingResponse(
+        stream_archive(),
+        media_type=ARCHIVE_MEDIA_TYPES[output_format],
+        headers={"Content-Disposition": f'attachment; filename="cleaned.{output_format}"'},
+    )
+
+
+@app.get("/clean/trace")
+def clean_trace(job_id: str):
+    if not get_job(job_id):
+        raise HTTPException(status_code=404, detail="job not found")
+    path = trace_path(job_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="trace not available")
+    return FileResponse(path, media_type="application/json", filename=f"trace-{job_id}.json")
+
+
+@app.get("/clean/profile")
+def clean_profile(job_id: str, format: Literal["text", "json", "collapsed"] = "text"):
+    if not get_job(job_id):
+        raise HTTPException(status_code=404, detail="job not found")
+    summary_path = profile_dir() / f"{job_id}.json"
+    path = profile_dir() / f"{job_id}.collapsed.txt" if format == "collapsed" else summary_path
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="profile not available")
+    if format == "json":
+        return FileResponse(path, media_type="application/json", filename=f"profile-{job_id}.json")
+    if format == "collapsed":
+        return FileResponse(path, media_type="text/plain", filename=f"profile-{job_id}.collapsed.txt")
+    return PlainTextResponse(profiling.format_report(json.loads(summary_path.read_text())))
+
+
+def require_upload_queue():
+    if not UPLOAD_QUEUE:
+        raise HTTPException(status_code=404, detail="upload queue disabled")
+    return UPLOAD_QUEUE
+
+
+def redact_url(url: str) -> str:
+    """Drop the query string, which often carries the upload auth code."""
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(query="", fragment=""))
+
+
+@app.get("/upload-queue", response_model=UploadQueueResponse)
+def upload_queue(limit: int = 100):
+    queue = require_upload_queue()
+    entries = [{**entry, "upload_url": redact_url(entry["upload_url"])} for entry in queue.entries(limit)]
+    return UploadQueueResponse(**queue.counts(), entries=entries)
+
+
+@app.post("/upload-queue/flush", response_model=UploadQueueFlushResponse)
+def upload_queue_flush():
+    queue = require_upload_queue()
+    scheduled = queue.retry_now()
+    UPLOAD_QUEUE_WAKE.set()
+    return UploadQueueFlushResponse(scheduled=scheduled, **queue.counts())
+
+
+@app.delete("/upload-queue")
+def upload_queue_discard(entry_id: Optional[int] = None):
+    queue = require_upload_queue()
+    return {"discarded": queue.discard(entry_id)}
+
+
 @app.post("/upload-test", response_model=UploadTestResponse)
 def upload_test(request: UploadTestRequest):
     if not request.upload_url.strip():
@@ -0,0 +1,369 @@
+import io
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from pathlib import PurePosixPath
+
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".webp"}
+CHUNK_SIZE = 256 * 1024
+QUEUE_CHUNKS = 16
+DEFAULT_MAX_MEMBER_BYTES = 64 * 1024 * 1024
+
+ZIP_LOCAL_HEADER = b"PK\x03\x04"
+ZIP_DATA_DESCRIPTOR = b"PK\x07\x08"
+ZIP_LOCAL_STRUCT = struct.Struct("<4s5H3L2H")
+ZIP_FLAG_DATA_DESCRIPTOR = 0x08
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class HandoffQueue:
+    """Bounded FIFO between one worker thread and the event loop.
+
+    The thread side blocks on a condition variable; the loop side awaits a future that
+    the thread resolves through ``call_soon_threadsafe``. Unlike ``run_in_threadpool``
+    around a blocking queue, a full or empty queue parks no threadpool thread. Only one
+    coroutine may wait on the queue at a time.
+    """
+
+    def __init__(self, maxsize: int = QUEUE_CHUNKS, loop=None):
+        self.maxsize = maxsize
+        self.loop = loop
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._waiter = None
+        self._closed = False
+
+    def _wake(self):
+        # Called with the condition held after every state change.
+        self._cond.notify_all()
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            self.loop.call_soon_threadsafe(_resolve, waiter)
+
+    def put(self, item):
+        """Thread side: block while the queue is full. Raises ArchiveError once closed."""
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise ArchiveError("client stopped reading the response")
+            self._items.append(item)
+            self._wake()
+
+    def get(self):
+        """Thread side: block while the queue is empty."""
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            item = self._items.popleft()
+            self._wake()
+            return item
+
+    async def put_async(self, item):
+        while True:
+            with self._cond:
+                if len(self._items) < self.maxsize:
+                    self._items.append(item)
+                    self._wake()
+                    return
+                waiter = self._waiter = self.loop.create_future()
+            await waiter
+
+    async def get_async(self):
+        while True:
+            with self._cond:
+                if self._items:
+                    item = self._items.popleft()
+                    self._wake()
+                    return item
+                waiter = self._waiter = self.loop.create_future()
+            await waiter
+
+    def close(self):
+        """Make blocked and future ``put`` calls fail, e.g. after the client went away."""
+        with self._cond:
+            self._closed = True
+            self._wake()
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ChunkReader:
+    """Blocking file-like object fed chunk by chunk from the event loop or another thread.
+
+    At most ``QUEUE_CHUNKS`` chunks are buffered; ``feed_async`` waits when the consumer
+    falls behind, which pushes back on the upload instead of growing memory.
+    """
+
+    def __init__(self, maxsize: int = QUEUE_CHUNKS, loop=None):
+        self._queue = HandoffQueue(maxsize, loop)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def feed(self, chunk: bytes):
+        self._queue.put(bytes(chunk))
+
+    def close_feed(self):
+        self._queue.put(None)
+
+    async def feed_async(self, chunk: bytes):
+        await self._queue.put_async(bytes(chunk))
+
+    async def close_feed_async(self):
+        await self._queue.put_async(None)
+
+    def _fill(self, size: int) -> bool:
+        while len(self._buffer) < size and not self._eof:
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        return len(self._buffer) >= size
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            while self._fill(len(self._buffer) + CHUNK_SIZE):
+                pass
+            size = len(self._buffer)
+        else:
+            self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read_some(self) -> bytes:
+        if not self._buffer:
+            self._fill(1)
+        return self.read(len(self._buffer))
+
+    def peek(self, size: int) -> bytes:
+        self._fill(size)
+        return bytes(self._buffer[:size])
+
+    def unread(self, data: bytes):
+        self._buffer[:0] = data
+
+    def skip(self, size: int):
+        while size > 0:
+            data = self.read(min(size, CHUNK_SIZE))
+            if not data:
+                raise ArchiveError("truncated zip stream")
+            size -= len(data)
+
+    def drain(self):
+        while not self._eof:
+            self._buffer.clear()
+            self._fill(CHUNK_SIZE)
+        self._buffer.clear()
+
+
+class QueueWriter:
+    """Write-only file-like object handing chunks to a bounded queue for the response."""
+
+    def __init__(self, maxsize: int = QUEUE_CHUNKS, loop=None):
+        self.queue = HandoffQueue(maxsize, loop)
+        self._pending = bytearray()
+
+    def write(self, data) -> int:
+        self._pending += data
+        if len(self._pending) >= CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._pending:
+            self.queue.put(bytes(self._pending))
+            self._pending = bytearray()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+
+    def abandon(self):
+        self.queue.close()
+
+
+def is_image_member(name: str) -> bool:
+    return PurePosixPath(name).suffix.lower() in IMAGE_EXTS
+
+
+def iter_tar_members(reader, max_member_bytes: int = DEFAULT_MAX_MEMBER_BYTES):
+    """Yield ``(name, data)`` per regular file; ``data`` is None for members over ``max_member_bytes``."""
+    try:
+        with tarfile.open(fileobj=reader, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                if member.size > max_member_bytes:
+                    # Not extracted; the stream skips over its data.
+                    yield member.name, None
+                    continue
+                f = tar.extractfile(member)
+                yield member.name, f.read() if f else b""
+    except tarfile.TarError as exc:
+        raise ArchiveError(f"invalid tar stream: {exc}") from exc
+
+
+def read_exact(reader: ChunkReader, size: int) -> bytes:
+    data = reader.read(size)
+    if len(data) != size:
+        raise ArchiveError("truncated zip stream")
+    return data
+
+
+def inflate(decomp, data: bytes, out, limit: int):
+    """Inflate ``data`` in bounded steps so a zip bomb never expands in one call.
+
+    ``out`` collects the output until it passes ``limit``; from then on it is None and the
+    output is discarded. Returns the new ``out``.
+    """
+    while not decomp.eof:
+        piece = decomp.decompress(data, CHUNK_SIZE)
+        if out is not None:
+            out += piece
+            if len(out) > limit:
+                out = None
+        data = decomp.unconsumed_tail
+        if not data and len(piece) < CHUNK_SIZE:
+            # Input used up and no output held back by the step size.
+            break
+    return out
+
+
+def read_deflated(reader: ChunkReader, limit: int):
+    decomp = zlib.decompressobj(-15)
+    out = bytearray()
+    while not decomp.eof:
+        chunk = reader.read_some()
+        if not chunk:
+            raise ArchiveError("truncated zip stream")
+        out = inflate(decomp, chunk, out, limit)
+    if decomp.unused_data:
+        reader.unread(decomp.unused_data)
+    return bytes(out) if out is not None else None
+
+
+def read_stored_until_descriptor(reader: ChunkReader, limit: int):
+    # Stored entries written to an unseekable stream carry their size only in the
+    # trailing data descriptor, so scan for a descriptor whose size and CRC match.
+    # Past ``limit`` only a 15-byte window is kept, with the size and CRC of what
+    # was dropped, so an oversized entry is skipped in constant memory.
+    data = bytearray()
+    dropped = 0
+    dropped_crc = 0
+    while True:
+        chunk = reader.read_some()
+        if not chunk:
+            raise ArchiveError("truncated zip stream")
+        start = max(0, len(data) - 15)
+        data += chunk
+        pos = data.find(ZIP_DATA_DESCRIPTOR, start)
+        while pos != -1:
+            if len(data) >= pos + 16:
+                _, crc, csize, _ = struct.unpack("<4s3L", data[pos:pos + 16])
+                if csize == dropped + pos and zlib.crc32(data[:pos], dropped_crc) == crc:
+                    reader.unread(bytes(data[pos:]))
+                    return bytes(data[:pos]) if not dropped and pos <= limit else None
+            pos = data.find(ZIP_DATA_DESCRIPTOR, pos + 1)
+        if dropped + len(data) > limit and len(data) > 15:
+            cut = len(data) - 15
+            dropped_crc = zlib.crc32(data[:cut], dropped_crc)
+            dropped += cut
+            del data[:cut]
+
+
+def skip_data_descriptor(reader: ChunkReader):
+    head = reader.peek(4)
+    size = 16 if head == ZIP_DATA_DESCRIPTOR else 12
+    read_exact(reader, size)
+
+
+def iter_zip_members(reader: ChunkReader, max_member_bytes: int = DEFAULT_MAX_MEMBER_BYTES):
+    """Yield ``(name, data)`` from a zip read front to back through its local headers.
+
+    ``data`` is None for entries that would inflate to more than ``max_member_bytes``.
+    """
+    while True:
+        signature = reader.peek(4)
+        if signature != ZIP_LOCAL_HEADER:
+            # Central directory (or end of stream): every entry has been read.
+            reader.drain()
+            return
+        header = ZIP_LOCAL_STRUCT.unpack(read_exact(reader, ZIP_LOCAL_STRUCT.size))
+        _, _, flags, method, _, _, _, csize, _, name_len, extra_len = header
+        name = read_exact(reader, name_len).decode("utf-8", "replace")
+        read_exact(reader, extra_len)
+        if method not in (ZIP_STORED, ZIP_DEFLATED):
+            raise ArchiveError(f"unsupported zip compression method {method}: {name}")
+
+        if flags & ZIP_FLAG_DATA_DESCRIPTOR:
+            if method == ZIP_DEFLATED:
+                data = read_deflated(reader, max_member_bytes)
+            else:
+                data = read_stored_until_descriptor(reader, max_member_bytes)
+            skip_data_descriptor(reader)
+        elif csize > max_member_bytes:
+            reader.skip(csize)
+            data = None
+        elif method == ZIP_DEFLATED:
+            out = inflate(zlib.decompressobj(-15), read_exact(reader, csize), bytearray(), max_member_bytes)
+            data = bytes(out) if out is not None else None
+        else:
+            data = read_exact(reader, csize)
+
+        if not name.endswith("/"):
+            yield name, data
+
+
+def iter_archive_members(reader: ChunkReader, max_member_bytes: int = DEFAULT_MAX_MEMBER_BYTES):
+    """Yield ``(name, data)`` for every regular file of a zip or (optionally compressed) tar stream.
+
+    ``data`` is None for members larger than ``max_member_bytes``; their content is skipped.
+    """
+    if reader.peek(4) == ZIP_LOCAL_HEADER:
+        yield from iter_zip_members(reader, max_member_bytes)
+    else:
+        yield from iter_tar_members(reader, max_member_bytes)
+
+
+class TarStreamWriter:
+    def __init__(self, fileobj):
+        self.tar = tarfile.open(fileobj=fileobj, mode="w|")
+
+    def add(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+
+class ZipStreamWriter:
+    def __init__(self, fileobj):
+        self.zip = zipfile.ZipFile(fileobj, mode="w", compression=zipfile.ZIP_STORED)
+
+    def add(self, name: str, data: bytes):
+        self.zip.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data)
+
+    def close(self):
+        self.zip.close()
+
+
+ARCHIVE_WRITERS = {"tar": TarStreamWriter, "zip": ZipStreamWriter}
+ARCHIVE_MEDIA_TYPES = {"tar": "application/x-tar", "zip": "application/zip"}
@@ -0,0 +1,375 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_STALE_SECONDS = 30.0
+LOGGER = logging.getLogger("job_store")
+
+FILE_PENDING = "pending"
+FILE_CLEANED = "cleaned"
+FILE_FAILED = "failed"
+FILE_SKIPPED = "skipped"
+FILE_UPLOADED = "uploaded"
+FILE_UPLOAD_FAILED = "upload_failed"
+
+
+def new_job(job_id: str, total: int) -> dict:
+    return {
+        "job_id": job_id,
+        "total": total,
+        "success": 0,
+        "failed": 0,
+        "skipped": 0,
+        "upload_total": 0,
+        "upload_success": 0,
+        "upload_failed": 0,
+        "work_total": 0,
+        "work_remaining": 0,
+        "done": False,
+        "cancelled": False,
+        "error": None,
+    }
+
+
+class MemoryJobStore:
+    """Process-local job store. Jobs are lost on restart and invisible to other workers."""
+
+    def __init__(self):
+        self.jobs: dict[str, dict] = {}
+        self.jobs_lock = threading.Lock()
+
+    def init_job(self, job_id: str, total: int, meta: Optional[dict] = None, files=None):
+        with self.jobs_lock:
+            self.jobs[job_id] = new_job(job_id, total)
+
+    def update_job(self, job_id: str, **updates):
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            job.update(updates)
+
+    def get_job(self, job_id: str):
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            return dict(job)
+
+    def request_cancel(self, job_id: str) -> bool:
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return False
+            if not job["done"]:
+                job["cancelled"] = True
+            return True
+
+    def is_cancelled(self, job_id: str) -> bool:
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            return bool(job and job.get("cancelled"))
+
+    def mark_file(self, job_id: str, path: str, state: str, output: Optional[str] = None):
+        pass
+
+    def mark_file_output(self, job_id: str, output: str, state: str):
+        pass
+
+    def pending_files(self, job_id: str):
+        return [], []
+
+    def orphaned_jobs(self):
+        return []
+
+    def claim_job(self, job_id: str) -> bool:
+        return False
+
+    def heartbeat(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore:
+    """Job store shared by every worker process through one SQLite database in WAL mode.
+
+    Counter updates and per-file states are buffered in process memory and written in one
+    transaction at most every ``flush_interval`` seconds (immediately once a job is done),
+    so per-file progress never waits on the disk. Each running job carries the id of the
+    process that owns it and a heartbeat; jobs whose owner stopped heartbeating are
+    reported by ``orphaned_jobs`` and can be claimed and resumed from their pending files.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        stale_seconds: float = DEFAULT_STALE_SECONDS,
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.stale_seconds = stale_seconds
+        self.owner = uuid.uuid4().hex
+        self.jobs: dict[str, dict] = {}
+        self.jobs_lock = threading.Lock()
+        self._dirty: set[str] = set()
+        self._file_updates: list[tuple] = []
+        self._output_updates: list[tuple] = []
+        self._last_flush = time.monotonic()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                meta TEXT,
+                owner TEXT,
+                heartbeat REAL NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                cancel_requested INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                state TEXT NOT NULL,
+                output TEXT,
+                PRIMARY KEY (job_id, path)
+            );
+            """
+        )
+
+    def init_job(self, job_id: str, total: int, meta: Optional[dict] = None, files=None):
+        job = new_job(job_id, total)
+        with self.jobs_lock:
+            self.jobs[job_id] = job
+            snapshot = dict(job)
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO jobs (job_id, state, meta, owner, heartbeat, done) VALUES (?, ?, ?, ?, ?, 0)",
+                    (job_id, json.dumps(snapshot), json.dumps(meta or {}), self.owner, time.time()),
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO job_files (job_id, path, state, output) VALUES (?, ?, ?, NULL)",
+                    [(job_id, str(path), FILE_PENDING) for path in files or []],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_job(self, job_id: str, **updates):
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            job.update(updates)
+            self._dirty.add(job_id)
+            force = bool(updates.get("done"))
+        self._maybe_flush(force)
+
+    def get_job(self, job_id: str):
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job)
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT state, done, cancel_requested FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if not row:
+            return None
+        job = json.loads(row[0])
+        if row[2] and not row[1]:
+            # Requested on another worker; the owner picks it up on its next heartbeat.
+            job["cancelled"] = True
+        return job
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Flag a job for cancellation. The owning worker sees it immediately if it is this
+        process, otherwise on its next heartbeat."""
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if job and not job["done"]:
+                job["cancelled"] = True
+                self._dirty.add(job_id)
+        with self._db_lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND done = 0",
+                (job_id,),
+            )
+            if cur.rowcount:
+                return True
+            row = self._conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row is not None
+
+    def is_cancelled(self, job_id: str) -> bool:
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return bool(job.get("cancelled"))
+        with self._db_lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def mark_file(self, job_id: str, path: str, state: str, output: Optional[str] = None):
+        with self.jobs_lock:
+            self._file_updates.append((state, output, job_id, str(path)))
+        self._maybe_flush(False)
+
+    def mark_file_output(self, job_id: str, output: str, state: str):
+        with self.jobs_lock:
+            self._output_updates.append((state, job_id, str(output)))
+        self._maybe_flush(False)
+
+    def pending_files(self, job_id: str):
+        """Return ``(to_clean, to_upload)``: input paths not cleaned yet and outputs not uploaded yet."""
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT path, state, output FROM job_files WHERE job_id = ? ORDER BY rowid",
+                (job_id,),
+            ).fetchall()
+        to_clean = [path for path, state, _ in rows if state == FILE_PENDING]
+        to_upload = [output for _, state, output in rows if state == FILE_CLEANED and output]
+        return to_clean, to_upload
+
+    def orphaned_jobs(self):
+        cutoff = time.time() - self.stale_seconds
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT state, meta FROM jobs WHERE done = 0 AND owner != ? AND heartbeat < ?",
+                (self.owner, cutoff),
+            ).fetchall()
+        jobs = []
+        for state, meta in rows:
+            job = json.loads(state)
+            job["meta"] = json.loads(meta or "{}")
+            jobs.append(job)
+        return jobs
+
+    def claim_job(self, job_id: str) -> bool:
+        cutoff = time.time() - self.stale_seconds
+        with self._db_lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET owner = ?, heartbeat = ? WHERE job_id = ? AND done = 0 AND owner != ? AND heartbeat < ?",
+                (self.owner, time.time(), job_id, self.owner, cutoff),
+            )
+            if cur.rowcount != 1:
+                return False
+            row = self._conn.execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        with self.jobs_lock:
+            self.jobs[job_id] = json.loads(row[0])
+        return True
+
+    def heartbeat(self):
+        with self.jobs_lock:
+            running = [job_id for job_id, job in self.jobs.items() if not job["done"]]
+        if running:
+            with self._db_lock:
+                self._conn.executemany(
+                    "UPDATE jobs SET heartbeat = ? WHERE job_id = ? AND owner = ?",
+                    [(time.time(), job_id, self.owner) for job_id in running],
+                )
+                cancelled = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE owner = ? AND done = 0 AND cancel_requested = 1",
+                    (self.owner,),
+                ).fetchall()
+            with self.jobs_lock:
+                for (job_id,) in cancelled:
+                    job = self.jobs.get(job_id)
+                    if job and not job["cancelled"]:
+                        job["cancelled"] = True
+                        self._dirty.add(job_id)
+        self.flush()
+
+    def _maybe_flush(self, force: bool):
+        if force or time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except sqlite3.Error as exc:
+                # The buffered updates were kept; the next flush or heartbeat writes them.
+                LOGGER.warning("job store flush failed, will retry: %s", exc)
+
+    def flush(self):
+        with self.jobs_lock:
+            self._last_flush = time.monotonic()
+            if not self._dirty and not self._file_updates and not self._output_updates:
+                return
+            jobs = [(job_id, dict(self.jobs[job_id])) for job_id in self._dirty]
+            file_updates = self._file_updates
+            output_updates = self._output_updates
+            self._dirty = set()
+            self._file_updates = []
+            self._output_updates = []
+            for job_id, job in jobs:
+                if job["done"]:
+                    self.jobs.pop(job_id, None)
+        now = time.time()
+        with self._db_lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "UPDATE jobs SET state = ?, done = ?, heartbeat = ? WHERE job_id = ?",
+                    [(json.dumps(job), int(bool(job["done"])), now, job_id) for job_id, job in jobs],
+                )
+                self._conn.executemany(
+                    "UPDATE job_files SET state = ?, output = COALESCE(?, output) WHERE job_id = ? AND path = ?",
+                    file_updates,
+                )
+                self._conn.executemany(
+                    "UPDATE job_files SET state = ? WHERE job_id = ? AND output = ?",
+                    output_updates,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                self._restore(jobs, file_updates, output_updates)
+                raise
+
+    def _restore(self, jobs, file_updates, output_updates):
+        """Put updates taken by a failed flush back in front of anything buffered since."""
+        with self.jobs_lock:
+            for job_id, job in jobs:
+                self.jobs.setdefault(job_id, job)
+                self._dirty.add(job_id)
+            self._file_updates = file_updates + self._file_updates
+            self._output_updates = output_updates + self._output_updates
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+def create_job_store(base_dir: Path):
+    backend = os.environ.get("JOB_STORE", "memory").strip().lower()
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        db_path = os.environ.get("JOB_DB_PATH") or str(base_dir / ".gemini-clean" / "jobs.db")
+        return SQLiteJobStore(
+            Path(db_path),
+            flush_interval=float(os.environ.get("JOB_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)),
+            stale_seconds=float(os.environ.get("JOB_STALE_SECONDS", DEFAULT_STALE_SECONDS)),
+        )
+    raise ValueError(f"Unknown JOB_STORE backend: {backend}")
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_LEASE_TTL = 60.0
+DEFAULT_LEASE_POLL = 2.0
+DEFAULT_DONE_TTL = 7 * 24 * 3600.0
+
+CLAIMED = "claimed"
+BUSY = "busy"
+DONE = "done"
+
+
+def file_signature(path: Path) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+class LeaseManager:
+    """Per-file claim files on a volume shared by several service instances.
+
+    ``claim`` creates ``<lease_dir>/<hash>.lease`` with ``O_EXCL``, so exactly one
+    instance wins each input file. Held leases are renewed by touching them; a lease
+    not renewed for ``ttl`` seconds belongs to a crashed instance and may be taken
+    over. When a file is cleaned successfully, its lease is replaced by a done marker
+    holding the input's size and mtime, so peers skip it until the input changes; a
+    failed file only drops its lease, so it is tried again. Leases are keyed by the input
+    path and a ``scope`` naming the output settings, so a run writing elsewhere or
+    uploading to another host does its own work. ``prune`` removes done markers older
+    than ``done_ttl`` or whose input changed, and leftovers of crashed instances.
+    """
+
+    def __init__(self, lease_dir: Path, ttl: float = DEFAULT_LEASE_TTL, done_ttl: float = DEFAULT_DONE_TTL):
+        self.lease_dir = Path(lease_dir)
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.done_ttl = done_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def lease_path(self, path: Path, scope: str = "") -> Path:
+        key = hashlib.sha1(f"{Path(path).resolve()}\n{scope}".encode()).hexdigest()
+        return self.lease_dir / f"{key}.lease"
+
+    def claim(self, path: Path, scope: str = "") -> str:
+        """Return ``CLAIMED`` if this instance now owns ``path``, ``DONE`` if a peer already
+        finished it, or ``BUSY`` if a live peer holds it."""
+        try:
+            signature = file_signature(path)
+        except FileNotFoundError:
+            # A peer cleaned it with delete_originals.
+            return DONE
+        lease = self.lease_path(path, scope)
+        for _ in range(3):
+            try:
+                fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                try:
+                    st = os.stat(lease)
+                    state = json.loads(lease.read_text() or "{}")
+                except FileNotFoundError:
+                    continue
+                except ValueError:
+                    state = {}
+                if state.get("state") == DONE:
+                    if state.get("signature") == signature:
+                        return DONE
+                elif time.time() - st.st_mtime <= self.ttl:
+                    return BUSY
+                if not self.break_lease(lease, st):
+                    return BUSY
+                continue
+            with os.fdopen(fd, "w") as f:
+                state = {"state": "leased", "owner": self.owner, "path": str(Path(path).resolve()), "signature": signature}
+                json.dump(state, f)
+            with self._lock:
+                self._held[str(lease)] = (threading.get_ident(), signature)
+            return CLAIMED
+        return BUSY
+
+    def break_lease(self, lease: Path, seen: os.stat_result) -> bool:
+        """Remove a stale lease or outdated done marker. Only one contender can succeed."""
+        tmp = lease.with_name(f"{lease.name}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(lease, tmp)
+        except FileNotFoundError:
+            return True
+        st = os.stat(tmp)
+        if (st.st_ino, st.st_mtime_ns) != (seen.st_ino, seen.st_mtime_ns):
+            # A peer replaced the lease after we looked at it; put theirs back.
+            try:
+                os.link(tmp, lease)
+            except FileExistsError:
+                pass
+            os.unlink(tmp)
+            return False
+        os.unlink(tmp)
+        return True
+
+    def complete(self, path: Path, scope: str = ""):
+        """Mark ``path`` as cleaned, so peers with the same ``scope`` skip it."""
+        lease = self.lease_path(path, scope)
+        with self._lock:
+            held = self._held.pop(str(lease), None)
+        if not held:
+            return
+        tmp = lease.with_name(f"{lease.name}.{uuid.uuid4().hex}.tmp")
+        marker = {"state": DONE, "owner": self.owner, "path": str(Path(path).resolve()), "signature": held[1]}
+        tmp.write_text(json.dumps(marker))
+        os.replace(tmp, lease)
+
+    def release(self, path: Path, scope: str = ""):
+        """Drop the lease on ``path`` without marking it done, e.g. after the file failed."""
+        lease = self.lease_path(path, scope)
+        with self._lock:
+            held = self._held.pop(str(lease), None)
+        if not held:
+            return
+        try:
+            os.unlink(lease)
+        except FileNotFoundError:
+            pass
+
+    def release_held(self):
+        """Drop every lease still held by the calling thread, e.g. after a cancel or crash."""
+        ident = threading.get_ident()
+        with self._lock:
+            leases = [lease for lease, (owner, _) in self._held.items() if owner == ident]
+            for lease in leases:
+                del self._held[lease]
+        for lease in leases:
+            try:
+                os.unlink(lease)
+            except FileNotFoundError:
+                pass
+
+    def renew(self):
+        with self._lock:
+            leases = list(self._held)
+        for lease in leases:
+            try:
+                os.utime(lease)
+            except FileNotFoundError:
+                pass
+
+    def prune(self) -> int:
+        """Remove outdated done markers, expired leases and temporary files left by crashes."""
+        now = time.time()
+        with self._lock:
+            held = set(self._held)
+        removed = 0
+        for entry in self.lease_dir.iterdir():
+            try:
+                st = os.stat(entry)
+            except FileNotFoundError:
+                continue
+            age = now - st.st_mtime
+            if entry.suffix != ".lease":
+                if age > self.ttl and entry.suffix in (".tmp", ".stale"):
+                    try:
+                        os.unlink(entry)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+                continue
+            if str(entry) in held:
+                continue
+            try:
+                state = json.loads(entry.read_text() or "{}")
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                state = {}
+            if state.get("state") == DONE:
+                try:
+                    current = file_signature(Path(state.get("path", "")))
+                except OSError:
+                    current = None
+                stale = age > self.done_ttl or current != state.get("signature")
+            else:
+                stale = age > self.ttl
+            if stale and self.break_lease(entry, st):
+                removed += 1
+        return removed
+
+
+def create_lease_manager(base_dir: Path):
+    mode = os.environ.get("WORKER_COORDINATION", "none").strip().lower()
+    if mode == "none":
+        return None
+    if mode == "lease":
+        lease_dir = os.environ.get("LEASE_DIR") or str(base_dir / ".gemini-clean" / "leases")
+        return LeaseManager(
+            Path(lease_dir),
+            ttl=float(os.environ.get("LEASE_TTL", DEFAULT_LEASE_TTL)),
+            done_ttl=float(os.environ.get("LEASE_DONE_TTL", DEFAULT_DONE_TTL)),
+        )
+    raise ValueError(f"Unknown WORKER_COORDINATION mode: {mode}")
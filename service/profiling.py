@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_INTERVAL = 0.005
+TOP_FUNCTIONS = 40
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class JobProfiler:
+    """Sampling profiler for the thread that runs one clean job.
+
+    A background thread records the job thread's call stack every ``interval`` seconds.
+    Unlike ``cProfile`` it does not slow down the profiled code much, and several jobs
+    can be profiled at once. Stacks are aggregated into collapsed-stack lines
+    (``root;...;leaf count``) that flame graph tools read directly, plus per-function
+    self and cumulative sample counts.
+    """
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        lines = [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> list[dict]:
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] += count
+            for label in set(stack):
+                total_counts[label] += count
+        seconds_per_sample = self.duration / self.samples if self.samples else 0.0
+        functions = [
+            {
+                "function": label,
+                "self_samples": self_counts[label],
+                "cumulative_samples": count,
+                "self_seconds": round(self_counts[label] * seconds_per_sample, 4),
+                "cumulative_seconds": round(count * seconds_per_sample, 4),
+            }
+            for label, count in total_counts.items()
+        ]
+        functions.sort(key=lambda item: (item["self_samples"], item["cumulative_samples"]), reverse=True)
+        return functions[:limit]
+
+    def summary(self, name: str) -> dict:
+        return {
+            "name": name,
+            "interval": self.interval,
+            "duration": round(self.duration, 4),
+            "samples": self.samples,
+            "top": self.top_functions(),
+        }
+
+    def save(self, directory: Path, name: str):
+        directory.mkdir(parents=True, exist_ok=True)
+        # The summary goes last: once it exists, the collapsed stacks exist too.
+        for suffix, content in (
+            (".collapsed.txt", self.collapsed()),
+            (".json", json.dumps(self.summary(name), indent=2)),
+        ):
+            path = directory / f"{name}{suffix}"
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_text(content)
+            os.replace(tmp_path, path)
+
+
+def format_report(summary: dict) -> str:
+    """Render a saved profile summary as a plain-text table, heaviest self time first."""
+    lines = [
+        f"profile {summary['name']}: {summary['samples']} samples over {summary['duration']:.2f}s "
+        f"(every {summary['interval'] * 1000:g} ms)",
+        "",
+        f"{'self s':>9} {'self %':>7} {'cum s':>9} {'cum %':>7}  function",
+    ]
+    samples = summary["samples"] or 1
+    for item in summary["top"]:
+        lines.append(
+            f"{item['self_seconds']:>9.3f} {100 * item['self_samples'] / samples:>6.1f}% "
+            f"{item['cumulative_seconds']:>9.3f} {100 * item['cumulative_samples'] / samples:>6.1f}%  {item['function']}"
+        )
+    return "\n".join(lines) + "\n"
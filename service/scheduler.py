@@ -0,0 +1,45 @@
+import threading
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+WAIT_POLL_SECONDS = 0.2
+
+
+class PriorityGate:
+    """Lets interactive jobs preempt bulk jobs between files.
+
+    Every running job registers its priority. Before each file a bulk job calls
+    ``wait_turn``, which blocks while any interactive job is registered, so a bulk
+    job yields after the file it is working on and resumes once interactive work is done.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._interactive = 0
+
+    def register(self, priority: str):
+        if priority != PRIORITY_INTERACTIVE:
+            return
+        with self._cond:
+            self._interactive += 1
+
+    def unregister(self, priority: str):
+        if priority != PRIORITY_INTERACTIVE:
+            return
+        with self._cond:
+            self._interactive -= 1
+            self._cond.notify_all()
+
+    def wait_turn(self, priority: str, should_stop=None):
+        if priority == PRIORITY_INTERACTIVE:
+            return
+        with self._cond:
+            while self._interactive > 0:
+                if should_stop and should_stop():
+                    return
+                self._cond.wait(WAIT_POLL_SECONDS)
+
+    def interactive_running(self) -> int:
+        with self._cond:
+            return self._interactive
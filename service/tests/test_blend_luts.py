@@ -0,0 +1,63 @@
+import os
+import random
+import sys
+import unittest
+
+from PIL import Image
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+
+
+def reference_remove_watermark(image, alpha_map, wm_size, pos_x, pos_y):
+    pixels = image.load()
+    for row in range(wm_size):
+        for col in range(wm_size):
+            alpha = alpha_map[row * wm_size + col]
+            if alpha < app_module.ALPHA_THRESHOLD:
+                continue
+            alpha = min(alpha, app_module.MAX_ALPHA)
+            one_minus = 1.0 - alpha
+            x = pos_x + col
+            y = pos_y + row
+            r, g, b, a = pixels[x, y]
+            r = int(max(0, min(255, round((r - alpha * app_module.LOGO_VALUE) / one_minus))))
+            g = int(max(0, min(255, round((g - alpha * app_module.LOGO_VALUE) / one_minus))))
+            b = int(max(0, min(255, round((b - alpha * app_module.LOGO_VALUE) / one_minus))))
+            pixels[x, y] = (r, g, b, a)
+    return image
+
+
+class BlendLutTests(unittest.TestCase):
+    def setUp(self):
+        if app_module.BLEND_LUTS_48 is None or app_module.BLEND_LUTS_96 is None:
+            app_module.load_assets()
+
+    def test_tables_are_shared_per_alpha(self):
+        luts = app_module.BLEND_LUTS_96
+        tables = {id(table) for table in luts if table is not None}
+        alphas = {alpha for alpha in app_module.ALPHA_96 if alpha >= app_module.ALPHA_THRESHOLD}
+        self.assertEqual(len(luts), 96 * 96)
+        self.assertEqual(len(tables), len(alphas))
+        self.assertTrue(all(isinstance(table, bytes) and len(table) == 256 for table in luts if table))
+
+    def test_output_matches_float_arithmetic(self):
+        rng = random.Random(1234)
+        for size, alpha_map, luts in (
+            (48, app_module.ALPHA_48, app_module.BLEND_LUTS_48),
+            (96, app_module.ALPHA_96, app_module.BLEND_LUTS_96),
+        ):
+            with self.subTest(size=size):
+                data = bytes(rng.getrandbits(8) for _ in range(size * size * 4))
+                img = Image.frombytes("RGBA", (size, size), data)
+                expected = reference_remove_watermark(img.copy(), alpha_map, size, 0, 0)
+                actual = app_module.remove_watermark(img.copy(), luts, size, 0, 0)
+                self.assertEqual(actual.tobytes(), expected.tobytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
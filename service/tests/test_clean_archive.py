@@ -0,0 +1,186 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import unittest
+import zipfile
+
+from PIL import Image
+from fastapi.testclient import TestClient
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+from archive_stream import ChunkReader, HandoffQueue, iter_archive_members
+
+
+def png_bytes(size=128) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGBA", (size, size), (255, 0, 0, 255)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_tar(members) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class UnseekableBuffer:
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+
+def make_zip(members, compression, seekable=True) -> bytes:
+    target = io.BytesIO() if seekable else UnseekableBuffer()
+    with zipfile.ZipFile(target, "w", compression=compression) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return (target if seekable else target.buffer).getvalue()
+
+
+def read_members(data: bytes, max_member_bytes: int = 1 << 30):
+    reader = ChunkReader()
+
+    def feed():
+        for i in range(0, len(data), 1000):
+            reader.feed(data[i:i + 1000])
+        reader.close_feed()
+
+    threading.Thread(target=feed, daemon=True).start()
+    return list(iter_archive_members(reader, max_member_bytes))
+
+
+class HandoffQueueTests(unittest.TestCase):
+    def test_loop_and_thread_hand_off_in_order(self):
+        async def run():
+            loop = asyncio.get_running_loop()
+            to_thread = HandoffQueue(2, loop)
+            from_thread = HandoffQueue(2, loop)
+
+            def echo():
+                while True:
+                    item = to_thread.get()
+                    from_thread.put(item)
+                    if item is None:
+                        return
+
+            threading.Thread(target=echo, daemon=True).start()
+
+            async def produce():
+                for i in range(200):
+                    await to_thread.put_async(i)
+                await to_thread.put_async(None)
+
+            producer = asyncio.create_task(produce())
+            received = []
+            while (item := await from_thread.get_async()) is not None:
+                received.append(item)
+            await producer
+            return received
+
+        self.assertEqual(asyncio.run(run()), list(range(200)))
+
+    def test_put_fails_once_closed(self):
+        queue = HandoffQueue(1)
+        queue.put(b"a")
+        threading.Timer(0.05, queue.close).start()
+        with self.assertRaises(app_module.ArchiveError):
+            queue.put(b"b")
+
+
+class ArchiveReaderTests(unittest.TestCase):
+    def test_zip_variants_stream_in_order(self):
+        members = [("a.png", png_bytes()), ("dir/", b""), ("dir/b.txt", b"PK\x07\x08 not a descriptor")]
+        expected = [("a.png", members[0][1]), ("dir/b.txt", members[2][1])]
+        for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            for seekable in (True, False):
+                with self.subTest(compression=compression, seekable=seekable):
+                    data = make_zip(members, compression, seekable)
+                    self.assertEqual(read_members(data), expected)
+
+    def test_oversized_members_are_skipped(self):
+        bomb = b"\0" * (4 * 1024 * 1024)
+        small = png_bytes()
+        members = [("bomb.png", bomb), ("a.png", small)]
+        for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            for seekable in (True, False):
+                with self.subTest(compression=compression, seekable=seekable):
+                    data = make_zip(members, compression, seekable)
+                    self.assertEqual(read_members(data, 1024 * 1024), [("bomb.png", None), ("a.png", small)])
+        with self.subTest(archive="tar"):
+            self.assertEqual(read_members(make_tar(members), 1024 * 1024), [("bomb.png", None), ("a.png", small)])
+
+    def test_tar_gz_stream(self):
+        members = [("a.png", png_bytes()), ("b.png", png_bytes())]
+        self.assertEqual(read_members(make_tar(members)), members)
+
+
+class CleanArchiveEndpointTests(unittest.TestCase):
+    def setUp(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        self.client = TestClient(app_module.app)
+
+    def test_tar_in_tar_out(self):
+        body = make_tar([("x/a.png", png_bytes()), ("tiny.png", png_bytes(16)), ("notes.txt", b"hi")])
+        resp = self.client.post("/clean/archive", content=body)
+        self.assertEqual(resp.status_code, 200)
+        with tarfile.open(fileobj=io.BytesIO(resp.content), mode="r:") as tar:
+            names = tar.getnames()
+            report = json.load(tar.extractfile(app_module.ARCHIVE_REPORT_NAME))
+            cleaned = Image.open(io.BytesIO(tar.extractfile("x/a_clean.png").read()))
+            self.assertEqual(cleaned.size, (128, 128))
+        self.assertEqual(names, ["x/a_clean.png", app_module.ARCHIVE_REPORT_NAME])
+        self.assertEqual(report["total"], 2)
+        self.assertEqual(report["success"], 1)
+        self.assertEqual(report["errors"], {"tiny.png": "image too small"})
+
+    def test_zip_in_zip_out(self):
+        body = make_zip([("a.png", png_bytes())], zipfile.ZIP_DEFLATED, seekable=False)
+        resp = self.client.post("/clean/archive", params={"output_format": "zip"}, content=body)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers["content-type"], "application/zip")
+        with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+            self.assertEqual(zf.namelist(), ["a_clean.png", app_module.ARCHIVE_REPORT_NAME])
+            self.assertEqual(json.loads(zf.read(app_module.ARCHIVE_REPORT_NAME))["success"], 1)
+
+    def test_oversized_member_reported_as_failed(self):
+        body = make_zip([("big.png", b"\0" * 100_000), ("a.png", png_bytes())], zipfile.ZIP_DEFLATED, seekable=False)
+        original = app_module.ARCHIVE_MAX_MEMBER_BYTES
+        app_module.ARCHIVE_MAX_MEMBER_BYTES = 50_000
+        try:
+            resp = self.client.post("/clean/archive", content=body)
+        finally:
+            app_module.ARCHIVE_MAX_MEMBER_BYTES = original
+        with tarfile.open(fileobj=io.BytesIO(resp.content), mode="r:") as tar:
+            report = json.load(tar.extractfile(app_module.ARCHIVE_REPORT_NAME))
+        self.assertEqual(report["success"], 1)
+        self.assertEqual(report["errors"], {"big.png": "member larger than 50000 bytes"})
+
+    def test_invalid_stream_reports_error(self):
+        resp = self.client.post("/clean/archive", content=b"not an archive")
+        self.assertEqual(resp.status_code, 200)
+        with tarfile.open(fileobj=io.BytesIO(resp.content), mode="r:") as tar:
+            report = json.load(tar.extractfile(app_module.ARCHIVE_REPORT_NAME))
+        self.assertIn("error", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
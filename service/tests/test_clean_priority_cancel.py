@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+
+
+def _touch(path: Path) -> None:
+    path.write_bytes(b"test")
+
+
+def _wait_done(client, job_id):
+    for _ in range(100):
+        status = client.get("/clean/status", params={"job_id": job_id}).json()
+        if status.get("done"):
+            return status
+        time.sleep(0.05)
+    raise AssertionError("job did not finish in time")
+
+
+class CleanPriorityCancelTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name).resolve()
+        for subdir, names in (("Bulk", ("a.png", "b.png", "c.png")), ("Manual", ("x.png", "y.png"))):
+            (self.base / subdir).mkdir()
+            for name in names:
+                _touch(self.base / subdir / name)
+        self.original_base = app_module.BASE_DIR
+        self.original_process = app_module.process_file
+        app_module.BASE_DIR = self.base
+        self.client = TestClient(app_module.app)
+
+    def tearDown(self):
+        app_module.BASE_DIR = self.original_base
+        app_module.process_file = self.original_process
+        self.tmp.cleanup()
+
+    def _start(self, subdir, priority):
+        resp = self.client.post(
+            "/clean/start",
+            json={"input_subdir": subdir, "output_subdir": "Output", "priority": priority},
+        )
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()["job_id"]
+
+    def test_cancel_stops_between_files(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fake_process_file(path: Path, output_dir: Path, delete_originals: bool):
+            started.set()
+            release.wait(5)
+            return True, str(output_dir / f"{path.stem}_clean.png")
+
+        app_module.process_file = fake_process_file
+        job_id = self._start("Bulk", "bulk")
+        self.assertTrue(started.wait(5))
+
+        resp = self.client.post("/clean/cancel", json={"job_id": job_id})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.json()["cancelled"])
+        release.set()
+
+        status = _wait_done(self.client, job_id)
+        self.assertTrue(status["cancelled"])
+        self.assertEqual(status["success"], 1)
+        self.assertEqual(status["total"], 3)
+
+    def test_cancel_unknown_job(self):
+        resp = self.client.post("/clean/cancel", json={"job_id": "missing"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_interactive_job_preempts_bulk_between_files(self):
+        events = []
+        bulk_started = threading.Event()
+        release_bulk = threading.Event()
+
+        def fake_process_file(path: Path, output_dir: Path, delete_originals: bool):
+            events.append(path.name)
+            if path.name == "a.png":
+                bulk_started.set()
+                release_bulk.wait(5)
+            return True, str(output_dir / f"{path.stem}_clean.png")
+
+        app_module.process_file = fake_process_file
+        bulk_id = self._start("Bulk", "bulk")
+        self.assertTrue(bulk_started.wait(5))
+
+        manual_id = self._start("Manual", "interactive")
+        manual_status = _wait_done(self.client, manual_id)
+        release_bulk.set()
+        bulk_status = _wait_done(self.client, bulk_id)
+
+        self.assertEqual(manual_status["success"], 2)
+        self.assertEqual(bulk_status["success"], 3)
+        self.assertEqual(events, ["a.png", "x.png", "y.png", "b.png", "c.png"])
+
+
+if __name__ == "__main__":
+    unittest.main()
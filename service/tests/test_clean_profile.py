@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from PIL import Image
+from fastapi.testclient import TestClient
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+from profiling import JobProfiler
+
+
+def write_png(path: Path, size: int = 128):
+    img = Image.new("RGBA", (size, size), (255, 0, 0, 255))
+    img.save(path, format="PNG")
+
+
+def busy_loop(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class JobProfilerTests(unittest.TestCase):
+    def test_samples_only_the_profiled_thread(self):
+        worker = threading.Thread(target=busy_loop, args=(0.2,))
+        worker.start()
+        profiler = JobProfiler(worker.ident, interval=0.002)
+        profiler.start()
+        busy_loop(0.1)
+        worker.join()
+        profiler.stop()
+
+        self.assertGreater(profiler.samples, 0)
+        collapsed = profiler.collapsed()
+        first = collapsed.splitlines()[0]
+        stack, count = first.rsplit(" ", 1)
+        self.assertTrue(stack.split(";")[-1].startswith("busy_loop "))
+        self.assertGreater(int(count), 0)
+        top = profiler.top_functions()
+        self.assertTrue(top[0]["function"].startswith("busy_loop "))
+        self.assertNotIn("test_samples_only_the_profiled_thread", collapsed)
+
+
+class CleanProfileTests(unittest.TestCase):
+    def setUp(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name).resolve()
+        (self.base / "Input").mkdir()
+        for name in ("a.png", "b.png", "c.png"):
+            write_png(self.base / "Input" / name, size=1100)
+        self.original_base = app_module.BASE_DIR
+        self.original_interval = app_module.PROFILE_INTERVAL
+        app_module.BASE_DIR = self.base
+        app_module.PROFILE_INTERVAL = 0.001
+        self.client = TestClient(app_module.app)
+
+    def tearDown(self):
+        app_module.BASE_DIR = self.original_base
+        app_module.PROFILE_INTERVAL = self.original_interval
+        self.tmp.cleanup()
+
+    def _run_job(self, profile: bool):
+        resp = self.client.post(
+            "/clean/start",
+            json={"input_subdir": "Input", "output_subdir": "Output", "profile": profile},
+        )
+        job_id = resp.json()["job_id"]
+        for _ in range(200):
+            if self.client.get("/clean/status", params={"job_id": job_id}).json()["done"]:
+                return job_id
+            time.sleep(0.05)
+        self.fail("job did not finish in time")
+
+    def test_profile_downloadable_in_every_format(self):
+        job_id = self._run_job(profile=True)
+        resp = self.client.get("/clean/profile", params={"job_id": job_id, "format": "json"})
+        self.assertEqual(resp.status_code, 200)
+        summary = resp.json()
+        self.assertGreater(summary["samples"], 0)
+        self.assertTrue(any(item["function"].startswith("run_clean_loop ") for item in summary["top"]))
+
+        resp = self.client.get("/clean/profile", params={"job_id": job_id, "format": "collapsed"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("run_clean_job (app.py:", resp.text)
+
+        resp = self.client.get("/clean/profile", params={"job_id": job_id})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("cum %", resp.text)
+
+    def test_missing_collapsed_file_is_not_found(self):
+        job_id = self._run_job(profile=True)
+        (app_module.profile_dir() / f"{job_id}.collapsed.txt").unlink()
+        resp = self.client.get("/clean/profile", params={"job_id": job_id, "format": "collapsed"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_profile_not_recorded_by_default(self):
+        job_id = self._run_job(profile=False)
+        resp = self.client.get("/clean/profile", params={"job_id": job_id})
+        self.assertEqual(resp.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from PIL import Image
+from fastapi.testclient import TestClient
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+
+
+def write_png(path: Path):
+    img = Image.new("RGBA", (128, 128), (255, 0, 0, 255))
+    img.save(path, format="PNG")
+
+
+class CleanTraceTests(unittest.TestCase):
+    def setUp(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name).resolve()
+        (self.base / "Input").mkdir()
+        write_png(self.base / "Input" / "a.png")
+        self.original_base = app_module.BASE_DIR
+        app_module.BASE_DIR = self.base
+        self.client = TestClient(app_module.app)
+
+    def tearDown(self):
+        app_module.BASE_DIR = self.original_base
+        self.tmp.cleanup()
+
+    def _run_job(self, trace: bool):
+        resp = self.client.post(
+            "/clean/start",
+            json={"input_subdir": "Input", "output_subdir": "Output", "trace": trace},
+        )
+        job_id = resp.json()["job_id"]
+        for _ in range(100):
+            if self.client.get("/clean/status", params={"job_id": job_id}).json()["done"]:
+                return job_id
+            time.sleep(0.05)
+        self.fail("job did not finish in time")
+
+    def test_trace_contains_stage_spans(self):
+        job_id = self._run_job(trace=True)
+        resp = self.client.get("/clean/trace", params={"job_id": job_id})
+        self.assertEqual(resp.status_code, 200)
+        events = resp.json()["traceEvents"]
+        names = {event["name"] for event in events if event["ph"] == "X"}
+        self.assertTrue({"file", "decode", "kernel", "encode", "write", "job_update"} <= names)
+        file_span = next(event for event in events if event["name"] == "file")
+        self.assertEqual(file_span["args"], {"file": "a.png"})
+
+    def test_trace_not_recorded_by_default(self):
+        job_id = self._run_job(trace=False)
+        resp = self.client.get("/clean/trace", params={"job_id": job_id})
+        self.assertEqual(resp.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
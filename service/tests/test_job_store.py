@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+from job_store import FILE_CLEANED, SQLiteJobStore
+
+
+def write_png(path: Path):
+    img = Image.new("RGBA", (128, 128), (255, 0, 0, 255))
+    img.save(path, format="PNG")
+
+
+class SQLiteJobStoreTests(unittest.TestCase):
+    def test_status_visible_to_other_worker(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "jobs.db"
+            worker_a = SQLiteJobStore(db_path, flush_interval=60)
+            worker_b = SQLiteJobStore(db_path, flush_interval=60)
+            try:
+                worker_a.init_job("job1", 3)
+                self.assertEqual(worker_b.get_job("job1")["total"], 3)
+
+                worker_a.update_job("job1", success=1)
+                self.assertEqual(worker_a.get_job("job1")["success"], 1)
+                self.assertEqual(worker_b.get_job("job1")["success"], 0)
+
+                worker_a.update_job("job1", success=3, done=True)
+                job = worker_b.get_job("job1")
+                self.assertEqual(job["success"], 3)
+                self.assertTrue(job["done"])
+                self.assertIsNone(worker_b.get_job("missing"))
+            finally:
+                worker_a.close()
+                worker_b.close()
+
+    def test_cancel_from_other_worker_is_reported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "jobs.db"
+            owner = SQLiteJobStore(db_path, flush_interval=60)
+            other = SQLiteJobStore(db_path, flush_interval=60)
+            try:
+                owner.init_job("job1", 3)
+                self.assertTrue(other.request_cancel("job1"))
+                self.assertTrue(other.get_job("job1")["cancelled"])
+                self.assertFalse(owner.is_cancelled("job1"))
+                owner.heartbeat()
+                self.assertTrue(owner.is_cancelled("job1"))
+            finally:
+                owner.close()
+                other.close()
+
+    def test_failed_flush_keeps_updates_and_does_not_raise(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "jobs.db"
+            store = SQLiteJobStore(db_path, flush_interval=60)
+            reader = SQLiteJobStore(db_path)
+            blocker = sqlite3.connect(str(db_path), isolation_level=None)
+            try:
+                store.init_job("job1", 2, files=["a.png", "b.png"])
+                store._conn.execute("PRAGMA busy_timeout = 50")
+                blocker.execute("BEGIN IMMEDIATE")
+
+                with self.assertLogs("job_store", level="WARNING"):
+                    store.mark_file("job1", "a.png", FILE_CLEANED, "a_clean.png")
+                    store.update_job("job1", success=2, done=True)
+                self.assertTrue(store.get_job("job1")["done"])
+
+                blocker.execute("COMMIT")
+                store.flush()
+                job = reader.get_job("job1")
+                self.assertTrue(job["done"])
+                self.assertEqual(job["success"], 2)
+                self.assertEqual(reader.pending_files("job1"), (["b.png"], ["a_clean.png"]))
+            finally:
+                blocker.close()
+                store.close()
+                reader.close()
+
+    def test_orphaned_job_is_claimed_once_with_pending_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "jobs.db"
+            crashed = SQLiteJobStore(db_path)
+            crashed.init_job("job1", 3, meta={"output_dir": tmp}, files=["a.png", "b.png", "c.png"])
+            crashed.mark_file("job1", "a.png", FILE_CLEANED, "a_clean.png")
+            crashed.update_job("job1", success=1)
+            crashed.flush()
+
+            worker_a = SQLiteJobStore(db_path, stale_seconds=0.2)
+            worker_b = SQLiteJobStore(db_path, stale_seconds=0.2)
+            try:
+                time.sleep(0.3)
+                orphans = worker_a.orphaned_jobs()
+                self.assertEqual([job["job_id"] for job in orphans], ["job1"])
+                self.assertEqual(orphans[0]["meta"], {"output_dir": tmp})
+                self.assertTrue(worker_a.claim_job("job1"))
+                self.assertFalse(worker_b.claim_job("job1"))
+
+                to_clean, to_upload = worker_a.pending_files("job1")
+                self.assertEqual(to_clean, ["b.png", "c.png"])
+                self.assertEqual(to_upload, ["a_clean.png"])
+            finally:
+                crashed.close()
+                worker_a.close()
+                worker_b.close()
+
+
+class ResumeInterruptedJobTests(unittest.TestCase):
+    def test_resume_processes_only_remaining_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp).resolve()
+            input_dir = base / "Input"
+            output_dir = base / "Output"
+            input_dir.mkdir(parents=True, exist_ok=True)
+            for name in ("a.png", "b.png"):
+                write_png(input_dir / name)
+            images = sorted(input_dir.iterdir())
+
+            db_path = base / "jobs.db"
+            crashed = SQLiteJobStore(db_path)
+            request = app_module.CleanRequest(input_subdir="Input", output_subdir="Output")
+            crashed.init_job("job1", 2, meta=app_module.job_meta(output_dir, request), files=images)
+            crashed.mark_file("job1", str(images[0]), FILE_CLEANED, str(output_dir / "a_clean.png"))
+            crashed.update_job("job1", success=1)
+            crashed.flush()
+
+            processed = []
+            original_store = app_module.JOB_STORE
+            original_process = app_module.process_file
+
+            def fake_process_file(path: Path, out_dir: Path, delete_originals: bool):
+                processed.append(path.name)
+                return True, str(out_dir / f"{path.stem}_clean.png")
+
+            store = SQLiteJobStore(db_path, stale_seconds=0)
+            try:
+                app_module.JOB_STORE = store
+                app_module.process_file = fake_process_file
+                time.sleep(0.01)
+                self.assertEqual(app_module.resume_interrupted_jobs(), ["job1"])
+
+                for _ in range(50):
+                    job = app_module.get_job("job1")
+                    if job["done"]:
+                        break
+                    time.sleep(0.05)
+                self.assertTrue(job["done"])
+                self.assertEqual(job["success"], 2)
+                self.assertEqual(processed, ["b.png"])
+            finally:
+                app_module.JOB_STORE = original_store
+                app_module.process_file = original_process
+                crashed.close()
+                store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+from leases import BUSY, CLAIMED, DONE, LeaseManager
+
+
+def _touch(path: Path) -> None:
+    path.write_bytes(b"test")
+
+
+def run_worker(base: str, results):
+    base = Path(base)
+    log_path = base / "cleaned.log"
+
+    def fake_process_file(path: Path, output_dir: Path, delete_originals: bool):
+        with open(log_path, "a") as log:
+            log.write(f"{os.getpid()} {path.name}\n")
+        time.sleep(0.01)
+        return True, str(output_dir / f"{path.stem}_clean.png")
+
+    app_module.LEASES = LeaseManager(base / "leases", ttl=30)
+    app_module.LEASE_POLL_SECONDS = 0.05
+    app_module.process_file = fake_process_file
+    images = list(app_module.iter_images(base / "Input"))
+    result = app_module.run_clean_loop(images, base / "Output", app_module.CleanRequest())
+    results.put((result["success"], result["skipped"]))
+
+
+class LeaseManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        self.image = self.base / "a.png"
+        _touch(self.image)
+        self.node_a = LeaseManager(self.base / "leases", ttl=30)
+        self.node_b = LeaseManager(self.base / "leases", ttl=30)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_claim_is_exclusive_until_done(self):
+        self.assertEqual(self.node_a.claim(self.image), CLAIMED)
+        self.assertEqual(self.node_b.claim(self.image), BUSY)
+        self.node_a.complete(self.image)
+        self.assertEqual(self.node_b.claim(self.image), DONE)
+
+        os.utime(self.image, ns=(0, 1))
+        self.assertEqual(self.node_b.claim(self.image), CLAIMED)
+
+    def test_expired_lease_of_crashed_peer_is_reclaimed(self):
+        self.assertEqual(self.node_a.claim(self.image), CLAIMED)
+        lease = self.node_a.lease_path(self.image)
+        old = time.time() - 60
+        os.utime(lease, (old, old))
+        self.assertEqual(self.node_b.claim(self.image), CLAIMED)
+        self.assertEqual(self.node_a.claim(self.image), BUSY)
+
+    def test_release_held_frees_claims(self):
+        self.assertEqual(self.node_a.claim(self.image), CLAIMED)
+        self.node_a.release_held()
+        self.assertEqual(self.node_b.claim(self.image), CLAIMED)
+
+    def test_released_file_is_not_done(self):
+        self.assertEqual(self.node_a.claim(self.image), CLAIMED)
+        self.node_a.release(self.image)
+        self.assertEqual(self.node_b.claim(self.image), CLAIMED)
+
+    def test_done_marker_is_scoped(self):
+        self.assertEqual(self.node_a.claim(self.image, "out-a"), CLAIMED)
+        self.node_a.complete(self.image, "out-a")
+        self.assertEqual(self.node_b.claim(self.image, "out-a"), DONE)
+        self.assertEqual(self.node_b.claim(self.image, "out-b"), CLAIMED)
+
+    def test_prune_removes_outdated_markers(self):
+        other = self.base / "b.png"
+        _touch(other)
+        for path in (self.image, other):
+            self.node_a.claim(path)
+            self.node_a.complete(path)
+        os.utime(self.image, ns=(0, 1))
+        expired = self.node_a.lease_path(other)
+        self.assertEqual(self.node_a.prune(), 1)
+        self.assertFalse(self.node_a.lease_path(self.image).exists())
+        self.assertTrue(expired.exists())
+
+        old = time.time() - 8 * 24 * 3600
+        os.utime(expired, (old, old))
+        self.assertEqual(self.node_a.prune(), 1)
+        self.assertEqual(list(self.node_a.lease_dir.iterdir()), [])
+
+    def test_held_lease_survives_prune(self):
+        self.assertEqual(self.node_a.claim(self.image), CLAIMED)
+        old = time.time() - 60
+        os.utime(self.node_a.lease_path(self.image), (old, old))
+        self.assertEqual(self.node_a.prune(), 0)
+        self.assertEqual(self.node_b.prune(), 1)
+
+
+class LeaseRerunTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name).resolve()
+        (self.base / "Input").mkdir()
+        _touch(self.base / "Input" / "a.png")
+        self.images = list(app_module.iter_images(self.base / "Input"))
+        self.original_leases = app_module.LEASES
+        app_module.LEASES = LeaseManager(self.base / "leases", ttl=30)
+
+    def tearDown(self):
+        app_module.LEASES = self.original_leases
+        self.tmp.cleanup()
+
+    def _run(self, output: str, ok: bool = True, request=None):
+        def fake_process_file(path: Path, output_dir: Path, delete_originals: bool):
+            return ok, (str(output_dir / f"{path.stem}_clean.png") if ok else "broken")
+
+        with patch("app.process_file", side_effect=fake_process_file):
+            result = app_module.run_clean_loop(self.images, self.base / output, request or app_module.CleanRequest())
+        return result["success"], result["failed"], result["skipped"]
+
+    def test_rerun_with_other_settings_does_the_work(self):
+        self.assertEqual(self._run("Output"), (1, 0, 0))
+        self.assertEqual(self._run("Output"), (0, 0, 1))
+        self.assertEqual(self._run("Other"), (1, 0, 0))
+
+        request = app_module.CleanRequest(upload_enabled=True, upload_url="https://example.com/upload")
+        self.assertNotEqual(
+            app_module.lease_scope(self.base / "Output", request),
+            app_module.lease_scope(self.base / "Output", app_module.CleanRequest()),
+        )
+
+    def test_failed_file_is_retried(self):
+        self.assertEqual(self._run("Output", ok=False), (0, 1, 0))
+        self.assertEqual(self._run("Output"), (1, 0, 0))
+
+
+class MultiProcessLeaseTests(unittest.TestCase):
+    def test_processes_never_clean_the_same_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp)
+            (base / "Input").mkdir()
+            names = [f"img{i:02d}.png" for i in range(24)]
+            for name in names:
+                _touch(base / "Input" / name)
+
+            ctx = multiprocessing.get_context("fork")
+            results = ctx.Queue()
+            workers = [ctx.Process(target=run_worker, args=(tmp, results)) for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join(30)
+                self.assertEqual(worker.exitcode, 0)
+
+            counts = [results.get(timeout=5) for _ in workers]
+            cleaned = [line.split()[1] for line in (base / "cleaned.log").read_text().splitlines()]
+            self.assertEqual(sorted(cleaned), names)
+            self.assertEqual(sum(success for success, _ in counts), len(names))
+            for success, skipped in counts:
+                self.assertEqual(success + skipped, len(names))
+
+
+if __name__ == "__main__":
+    unittest.main()
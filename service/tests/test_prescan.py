@@ -0,0 +1,161 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+from fastapi.testclient import TestClient
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+from job_store import SQLiteJobStore
+
+
+def write_png(path: Path, size):
+    Image.new("RGBA", size, (255, 0, 0, 255)).save(path, format="PNG")
+
+
+class PrescanTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name).resolve()
+        self.input_dir = self.base / "Input"
+        self.input_dir.mkdir()
+        write_png(self.input_dir / "a_small.png", (128, 128))
+        write_png(self.input_dir / "b_large.png", (300, 200))
+        write_png(self.input_dir / "c_tiny.png", (32, 32))
+        (self.input_dir / "d_broken.png").write_bytes(b"test")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_plan_orders_largest_first_without_decoding(self):
+        images = list(app_module.iter_images(self.input_dir))
+        with patch.object(Image.Image, "load", side_effect=AssertionError("decoded")):
+            scheduled, rejected, costs = app_module.plan_images(images)
+
+        self.assertEqual([p.name for p in scheduled], ["b_large.png", "a_small.png", "d_broken.png"])
+        self.assertEqual([(p.name, reason) for p, reason in rejected], [("c_tiny.png", "image too small")])
+        self.assertEqual(costs[self.input_dir / "b_large.png"], 300 * 200)
+        self.assertEqual(costs[self.input_dir / "d_broken.png"], 0)
+
+    def test_status_reports_predicted_work(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        original_base = app_module.BASE_DIR
+        try:
+            app_module.BASE_DIR = self.base
+            client = TestClient(app_module.app)
+            job_id = client.post("/clean/start", json={"input_subdir": "Input", "output_subdir": "Output"}).json()["job_id"]
+            for _ in range(100):
+                status = client.get("/clean/status", params={"job_id": job_id}).json()
+                if status["done"]:
+                    break
+                time.sleep(0.05)
+            self.assertTrue(status["done"])
+            self.assertEqual(status["total"], 4)
+            self.assertEqual(status["success"], 2)
+            self.assertEqual(status["failed"], 2)
+            self.assertEqual(status["work_total"], 300 * 200 + 128 * 128)
+            self.assertEqual(status["work_remaining"], 0)
+        finally:
+            app_module.BASE_DIR = original_base
+
+    def test_sync_clean_runs_largest_first_and_counts_rejected(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        original_base = app_module.BASE_DIR
+        original_process = app_module.process_file
+        processed = []
+
+        def recording_process_file(path: Path, out_dir: Path, delete_originals: bool):
+            processed.append(path.name)
+            return original_process(path, out_dir, delete_originals)
+
+        try:
+            app_module.BASE_DIR = self.base
+            app_module.process_file = recording_process_file
+            client = TestClient(app_module.app)
+            resp = client.post("/clean", json={"input_subdir": "Input", "output_subdir": "Output"})
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            self.assertEqual(data["total"], 4)
+            self.assertEqual(data["success"], 2)
+            self.assertEqual(data["failed"], 2)
+            self.assertEqual(processed, ["b_large.png", "a_small.png", "d_broken.png"])
+        finally:
+            app_module.process_file = original_process
+            app_module.BASE_DIR = original_base
+
+    def test_start_returns_before_prescan(self):
+        original_base = app_module.BASE_DIR
+        original_plan = app_module.plan_images
+        release = threading.Event()
+
+        def slow_plan(images):
+            release.wait(5)
+            return original_plan(images)
+
+        try:
+            app_module.BASE_DIR = self.base
+            app_module.plan_images = slow_plan
+            client = TestClient(app_module.app)
+            resp = client.post("/clean/start", json={"input_subdir": "Input", "output_subdir": "Output"})
+            self.assertEqual(resp.status_code, 200)
+            status = client.get("/clean/status", params=resp.json()).json()
+            self.assertEqual(status["total"], 4)
+            self.assertEqual(status["work_total"], 0)
+            self.assertFalse(status["done"])
+        finally:
+            release.set()
+            app_module.plan_images = original_plan
+            app_module.BASE_DIR = original_base
+
+    def test_resumed_job_runs_largest_first(self):
+        images = sorted(app_module.iter_images(self.input_dir))
+        processed = []
+        original_store = app_module.JOB_STORE
+        original_process = app_module.process_file
+
+        def fake_process_file(path: Path, out_dir: Path, delete_originals: bool):
+            processed.append(path.name)
+            return True, str(out_dir / f"{path.stem}_clean.png")
+
+        db_path = self.base / "jobs.db"
+        crashed = SQLiteJobStore(db_path)
+        request = app_module.CleanRequest(input_subdir="Input", output_subdir="Output")
+        crashed.init_job("job1", len(images), meta=app_module.job_meta(self.base / "Output", request), files=images)
+        crashed.update_job("job1", work_total=1)
+        crashed.flush()
+        store = SQLiteJobStore(db_path, stale_seconds=0)
+        try:
+            app_module.JOB_STORE = store
+            app_module.process_file = fake_process_file
+            time.sleep(0.01)
+            self.assertEqual(app_module.resume_interrupted_jobs(), ["job1"])
+            for _ in range(50):
+                job = app_module.get_job("job1")
+                if job["done"]:
+                    break
+                time.sleep(0.05)
+            self.assertTrue(job["done"])
+            self.assertEqual(processed, ["b_large.png", "a_small.png", "d_broken.png"])
+            self.assertEqual(job["failed"], 1)
+            self.assertEqual(job["work_total"], 1)
+        finally:
+            app_module.JOB_STORE = original_store
+            app_module.process_file = original_process
+            crashed.close()
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
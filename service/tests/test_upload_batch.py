@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+
+
+def write_png(path: Path):
+    img = Image.new("RGBA", (128, 128), (255, 0, 0, 255))
+    img.save(path, format="PNG")
+
+
+def fake_batch(api_url, file_paths, delete_after):
+    return [(True, f"https://example.com/file/{os.path.basename(p)}", False) for p in file_paths]
+
+
+def fake_buffers(api_url, buffers):
+    return [(name != "c_clean.png", f"https://example.com/file/{name}") for name, _ in buffers]
+
+
+class UploadBatchTests(unittest.TestCase):
+    def setUp(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name).resolve()
+        self.input_dir = base / "Input"
+        self.output_dir = base / "Output"
+        self.input_dir.mkdir()
+        for name in ("a.png", "b.png", "c.png", "d.png", "e.png"):
+            write_png(self.input_dir / name)
+        self.images = list(app_module.iter_images(self.input_dir))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("app.handle_upload")
+    @patch("app.handle_upload_batch", side_effect=fake_batch)
+    def test_upload_phase_groups_files(self, batch_mock, single_mock):
+        single_mock.side_effect = lambda url, path, delete: (True, "https://example.com/file/single", False)
+        request = app_module.CleanRequest(
+            upload_enabled=True,
+            upload_url="https://example.com/upload",
+            upload_batch_size=2,
+        )
+        result = app_module.run_clean_loop(self.images, self.output_dir, request)
+
+        self.assertEqual([len(call.args[1]) for call in batch_mock.call_args_list], [2, 2])
+        self.assertEqual(single_mock.call_count, 1)
+        self.assertEqual(result["upload_total"], 5)
+        self.assertEqual(result["upload_success"], 5)
+        self.assertEqual(result["uploaded_urls"][0], "https://example.com/file/a_clean.png")
+
+    @patch("app.upload_buffers", side_effect=fake_buffers)
+    def test_inline_uploads_batch_in_memory(self, buffers_mock):
+        request = app_module.CleanRequest(
+            upload_enabled=True,
+            upload_url="https://example.com/upload",
+            delete_cleaned=True,
+            upload_batch_size=3,
+        )
+        result = app_module.run_clean_loop(self.images, self.output_dir, request)
+
+        self.assertEqual([len(call.args[1]) for call in buffers_mock.call_args_list], [3, 2])
+        self.assertEqual(result["success"], 5)
+        self.assertEqual(result["upload_success"], 4)
+        self.assertEqual(result["upload_failed"], 1)
+        self.assertEqual([p.name for p in self.output_dir.iterdir()], ["c_clean.png"])
+
+
+if __name__ == "__main__":
+    unittest.main()
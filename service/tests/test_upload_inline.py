@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+
+
+def write_png(path: Path):
+    img = Image.new("RGBA", (128, 128), (255, 0, 0, 255))
+    img.save(path, format="PNG")
+
+
+class InlineUploadTests(unittest.TestCase):
+    def setUp(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name).resolve()
+        self.input_dir = base / "Input"
+        self.output_dir = base / "Output"
+        self.input_dir.mkdir()
+        write_png(self.input_dir / "a.png")
+        self.request = app_module.CleanRequest(
+            upload_enabled=True,
+            upload_url="https://example.com/upload",
+            delete_cleaned=True,
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("app.upload_file")
+    @patch("app.upload_bytes")
+    def test_upload_only_mode_never_writes_cleaned_file(self, upload_bytes_mock, upload_file_mock):
+        upload_bytes_mock.return_value = (True, "https://example.com/file/a.png")
+        result = app_module.run_clean_loop(list(app_module.iter_images(self.input_dir)), self.output_dir, self.request)
+
+        self.assertEqual(result["success"], 1)
+        self.assertEqual(result["upload_total"], 1)
+        self.assertEqual(result["upload_success"], 1)
+        self.assertEqual(result["uploaded_urls"], ["https://example.com/file/a.png"])
+        self.assertFalse(self.output_dir.exists())
+        upload_file_mock.assert_not_called()
+        data = upload_bytes_mock.call_args.args[1]
+        self.assertTrue(data.startswith(b"\x89PNG"))
+        self.assertEqual(upload_bytes_mock.call_args.args[2], "a_clean.png")
+
+    @patch("app.upload_bytes")
+    def test_failed_upload_falls_back_to_disk(self, upload_bytes_mock):
+        upload_bytes_mock.return_value = (False, "HTTP 503")
+        result = app_module.run_clean_loop(list(app_module.iter_images(self.input_dir)), self.output_dir, self.request)
+
+        self.assertEqual(result["success"], 1)
+        self.assertEqual(result["upload_total"], 1)
+        self.assertEqual(result["upload_failed"], 1)
+        out_path = self.output_dir / "a_clean.png"
+        self.assertTrue(out_path.exists())
+        self.assertEqual(out_path.read_bytes(), upload_bytes_mock.call_args.args[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import app as app_module
+from upload_queue import UploadRetryQueue
+
+
+def write_png(path: Path):
+    img = Image.new("RGBA", (128, 128), (255, 0, 0, 255))
+    img.save(path, format="PNG")
+
+
+class UploadRetryQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "uploads.db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_backoff_and_exhaustion(self):
+        queue = UploadRetryQueue(self.db_path, base_delay=0, max_attempts=2)
+        try:
+            queue.add("https://example.com/upload", "/data/a.png", True, job_id="job1", error="timeout")
+            queue.add("https://example.com/upload", "/data/a.png", True, job_id="job1", error="timeout")
+            self.assertEqual(queue.counts(), {"pending": 1, "exhausted": 0})
+
+            entry = queue.claim_due()[0]
+            self.assertEqual(entry["path"], "/data/a.png")
+            self.assertEqual(queue.claim_due(), [])
+            queue.failed(entry, "timeout")
+            queue.failed(queue.claim_due()[0], "timeout")
+            self.assertEqual(queue.claim_due(), [])
+            self.assertEqual(queue.counts(), {"pending": 0, "exhausted": 1})
+            self.assertTrue(queue.entries()[0]["exhausted"])
+
+            queue.retry_now()
+            entry = queue.claim_due()[0]
+            queue.succeeded(entry["id"])
+            self.assertEqual(queue.entries(), [])
+        finally:
+            queue.close()
+
+    def test_backoff_delays_retries(self):
+        queue = UploadRetryQueue(self.db_path, base_delay=60)
+        try:
+            queue.add("https://example.com/upload", "/data/a.png", False)
+            self.assertEqual(queue.claim_due(), [])
+            self.assertEqual(queue.backoff(3), 240)
+        finally:
+            queue.close()
+
+    def test_entry_claimed_by_one_worker(self):
+        worker_a = UploadRetryQueue(self.db_path, base_delay=0)
+        worker_b = UploadRetryQueue(self.db_path, base_delay=0)
+        try:
+            worker_a.add("https://example.com/upload", "/data/a.png", False)
+            self.assertEqual(len(worker_a.claim_due()), 1)
+            self.assertEqual(worker_b.claim_due(), [])
+        finally:
+            worker_a.close()
+            worker_b.close()
+
+
+class UploadQueueDrainTests(unittest.TestCase):
+    def setUp(self):
+        if app_module.ALPHA_48 is None or app_module.ALPHA_96 is None:
+            app_module.load_assets()
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name).resolve()
+        self.input_dir = base / "Input"
+        self.output_dir = base / "Output"
+        self.input_dir.mkdir()
+        for name in ("a.png", "b.png"):
+            write_png(self.input_dir / name)
+        self.images = list(app_module.iter_images(self.input_dir))
+        self.queue = UploadRetryQueue(base / "uploads.db", base_delay=0)
+        self.original_queue = app_module.UPLOAD_QUEUE
+        app_module.UPLOAD_QUEUE = self.queue
+
+    def tearDown(self):
+        app_module.UPLOAD_QUEUE = self.original_queue
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def test_failed_uploads_are_retried_without_recleaning(self):
+        request = app_module.CleanRequest(
+            upload_enabled=True,
+            upload_url="https://example.com/upload",
+            delete_cleaned=True,
+        )
+        with patch("app.upload_bytes", return_value=(False, "host down")):
+            result = app_module.run_clean_loop(self.images, self.output_dir, request)
+        self.assertEqual(result["upload_failed"], 2)
+        self.assertEqual(self.queue.counts()["pending"], 2)
+
+        uploads = []
+
+        def fake_upload(api_url, file_path, delete_after):
+            uploads.append(os.path.basename(file_path))
+            os.remove(file_path)
+            return True, f"https://example.com/file/{os.path.basename(file_path)}", True
+
+        with patch("app.handle_upload", side_effect=fake_upload), patch("app.clean_image") as clean_mock:
+            drained = app_module.drain_upload_queue()
+
+        clean_mock.assert_not_called()
+        self.assertEqual(drained, {"uploaded": 2, "failed": 0, "missing": 0})
+        self.assertEqual(sorted(uploads), ["a_clean.png", "b_clean.png"])
+        self.assertEqual(self.queue.entries(), [])
+        self.assertEqual(list(self.output_dir.iterdir()), [])
+
+    def test_endpoints_inspect_and_flush(self):
+        cleaned = self.output_dir / "a_clean.png"
+        self.output_dir.mkdir()
+        write_png(cleaned)
+        self.queue.add("https://example.com/upload?authCode=secret", str(cleaned), False, error="timeout")
+        self.queue.add("https://example.com/upload?authCode=secret", str(self.output_dir / "gone.png"), False)
+
+        client = TestClient(app_module.app)
+        resp = client.get("/upload-queue")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["pending"], 2)
+        self.assertEqual(data["entries"][0]["last_error"], "timeout")
+        self.assertEqual(data["entries"][0]["upload_url"], "https://example.com/upload")
+        self.assertNotIn("secret", resp.text)
+
+        app_module.UPLOAD_QUEUE_WAKE.clear()
+        with patch("app.handle_upload") as upload_mock:
+            resp = client.post("/upload-queue/flush")
+        upload_mock.assert_not_called()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"scheduled": 2, "pending": 2, "exhausted": 0})
+        self.assertTrue(app_module.UPLOAD_QUEUE_WAKE.is_set())
+
+        with patch("app.handle_upload", return_value=(True, "https://example.com/file/a_clean.png", False)) as upload_mock:
+            drained = app_module.drain_upload_queue()
+        self.assertEqual(drained, {"uploaded": 1, "failed": 0, "missing": 1})
+        self.assertEqual(upload_mock.call_args.args[0], "https://example.com/upload?authCode=secret")
+        self.assertTrue(cleaned.exists())
+
+if __name__ == "__main__":
+    unittest.main()
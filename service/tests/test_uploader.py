@@ -1,6 +1,7 @@
 import os
 import sys
 import tempfile
+import time
 import unittest
 from unittest.mock import patch
 from requests.exceptions import ReadTimeout
@@ -10,7 +11,17 @@ SERVICE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
 if SERVICE_DIR not in sys.path:
     sys.path.insert(0, SERVICE_DIR)
 
-from uploader import build_full_url, parse_upload_response, upload_file, handle_upload
+import uploader
+from uploader import (
+    batch_items,
+    build_full_url,
+    handle_upload,
+    parse_upload_response,
+    upload_buffers,
+    upload_bytes,
+    upload_file,
+    upload_files,
+)
 
 
 class DummyResp:
@@ -85,6 +96,15 @@ class UploaderTests(unittest.TestCase):
         self.assertFalse(ok)
         self.assertTrue(str(err))
 
+    @patch("uploader.requests.post")
+    def test_upload_bytes_sends_buffer_with_filename(self, post):
+        post.return_value = DummyResp([{ "src": "/file/abc.png" }])
+        ok, url = upload_bytes("https://cfbed.sanyue.de/upload?authCode=abc", b"png-bytes", "abc_clean.png")
+        self.assertTrue(ok)
+        self.assertEqual(url, "https://cfbed.sanyue.de/file/abc.png")
+        filename, payload = post.call_args.kwargs["files"]["file"]
+        self.assertEqual(filename, "abc_clean.png")
+
     @patch("uploader.upload_file")
     def test_handle_upload_deletes_on_success(self, upload_file_mock):
         upload_file_mock.return_value = (True, "https://cfbed.sanyue.de/file/abc.jpg")
@@ -105,5 +125,92 @@ class UploaderTests(unittest.TestCase):
                 os.remove(tmp.name)
 
 
+class BatchUploadTests(unittest.TestCase):
+    API_URL = "https://cfbed.sanyue.de/upload?authCode=abc"
+
+    def setUp(self):
+        uploader.BATCH_UNSUPPORTED.clear()
+
+    def test_batch_items_caps_count_and_bytes(self):
+        batches = list(batch_items([5, 5, 5, 20, 1, 1, 1], max_count=3, max_bytes=16, size_of=lambda n: n))
+        self.assertEqual(batches, [[5, 5, 5], [20], [1, 1, 1]])
+
+    @patch("uploader.requests.post")
+    def test_upload_buffers_maps_sources_in_order(self, post):
+        post.return_value = DummyResp({"data": [{ "src": "/file/a.png" }, { "src": "https://cdn.test/b.png" }]})
+        results = upload_buffers(self.API_URL, [("a.png", b"a"), ("b.png", b"b")])
+        self.assertEqual(
+            results,
+            [(True, "https://cfbed.sanyue.de/file/a.png"), (True, "https://cdn.test/b.png")],
+        )
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual([name for name, (filename, _) in post.call_args.kwargs["files"]], ["file", "file"])
+
+    @patch("uploader.requests.post")
+    def test_partial_batch_resends_only_missing_files(self, post):
+        post.side_effect = [
+            DummyResp([{ "src": "/file/a.png" }]),
+            DummyResp([{ "src": "/file/b.png" }]),
+            DummyResp([{ "src": "/file/c.png" }]),
+            DummyResp([{ "src": "/file/d.png" }]),
+        ]
+        first = upload_buffers(self.API_URL, [("a.png", b"a"), ("b.png", b"b")])
+        second = upload_buffers(self.API_URL, [("c.png", b"c"), ("d.png", b"d")])
+        self.assertEqual([url for _, url in first + second], [
+            "https://cfbed.sanyue.de/file/a.png",
+            "https://cfbed.sanyue.de/file/b.png",
+            "https://cfbed.sanyue.de/file/c.png",
+            "https://cfbed.sanyue.de/file/d.png",
+        ])
+        self.assertEqual(post.call_count, 4)
+        self.assertEqual(post.call_args_list[1].kwargs["files"]["file"][0], "b.png")
+        self.assertIn(self.API_URL, uploader.BATCH_UNSUPPORTED)
+
+    @patch("uploader.requests.post")
+    def test_unsupported_flag_expires(self, post):
+        uploader.BATCH_UNSUPPORTED[self.API_URL] = time.monotonic() - 1
+        post.return_value = DummyResp([{ "src": "/file/a.png" }, { "src": "/file/b.png" }])
+        results = upload_buffers(self.API_URL, [("a.png", b"a"), ("b.png", b"b")])
+        self.assertTrue(all(ok for ok, _ in results))
+        self.assertEqual(post.call_count, 1)
+        self.assertNotIn(self.API_URL, uploader.BATCH_UNSUPPORTED)
+
+    @patch("uploader.requests.post")
+    def test_timeout_after_send_is_not_resent(self, post):
+        post.side_effect = ReadTimeout("boom")
+        results = upload_buffers(self.API_URL, [("a.png", b"a"), ("b.png", b"b")])
+        self.assertEqual([ok for ok, _ in results], [False, False])
+        self.assertEqual(post.call_count, 1)
+        self.assertNotIn(self.API_URL, uploader.BATCH_UNSUPPORTED)
+
+    @patch("uploader.requests.post")
+    def test_client_error_does_not_disable_batching(self, post):
+        post.side_effect = [
+            DummyResp({}, status=413),
+            DummyResp([{ "src": "/file/a.png" }]),
+            DummyResp([{ "src": "/file/b.png" }]),
+        ]
+        results = upload_buffers(self.API_URL, [("a.png", b"a"), ("b.png", b"b")])
+        self.assertTrue(all(ok for ok, _ in results))
+        self.assertEqual(post.call_count, 3)
+        self.assertNotIn(self.API_URL, uploader.BATCH_UNSUPPORTED)
+
+    @patch("uploader.requests.post")
+    def test_server_error_does_not_disable_batching(self, post):
+        post.side_effect = [
+            DummyResp({}, status=503),
+            DummyResp([{ "src": "/file/a.png" }]),
+            DummyResp([{ "src": "/file/b.png" }]),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, name) for name in ("a.png", "b.png")]
+            for path in paths:
+                with open(path, "wb") as f:
+                    f.write(b"png")
+            results = upload_files(self.API_URL, paths)
+        self.assertTrue(all(ok for ok, _ in results))
+        self.assertNotIn(self.API_URL, uploader.BATCH_UNSUPPORTED)
+
+
 if __name__ == "__main__":
     unittest.main()
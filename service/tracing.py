@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+_LOCAL = threading.local()
+
+
+class Tracer:
+    """Collects complete ("X") events in Chrome trace-event format for one job."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pid = os.getpid()
+        self.events: list[dict] = []
+        self.lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, args: dict):
+        event = {
+            "name": name,
+            "cat": "clean",
+            "ph": "X",
+            "ts": round(start * 1_000_000, 1),
+            "dur": round((end - start) * 1_000_000, 1),
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            events = list(self.events)
+        threads = sorted({event["tid"] for event in events})
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": self.name}}]
+        meta += [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": f"worker-{i}"}}
+            for i, tid in enumerate(threads)
+        ]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms"}
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.to_dict()))
+        os.replace(tmp_path, path)
+
+
+class Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer: Tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.add(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def activate(tracer):
+    _LOCAL.tracer = tracer
+
+
+def deactivate():
+    _LOCAL.tracer = None
+
+
+def span(name: str, **args):
+    """Time a block on the current thread's tracer; a shared no-op when tracing is off."""
+    tracer = getattr(_LOCAL, "tracer", None)
+    if tracer is None:
+        return NULL_SPAN
+    return Span(tracer, name, args)
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_RETRY_BASE = 30.0
+DEFAULT_RETRY_MAX_DELAY = 3600.0
+DEFAULT_RETRY_LIMIT = 20
+DEFAULT_RETRY_POLL = 10.0
+# How long a claimed entry is hidden from other drainers while its upload runs.
+CLAIM_SECONDS = 300.0
+
+
+class UploadRetryQueue:
+    """Durable queue of cleaned files whose upload failed, kept in SQLite on the data volume.
+
+    Entries are keyed by ``(upload_url, path)``, so a file failing again is not queued
+    twice. A drainer ``claim_due`` entries whose backoff has expired, retries them and
+    reports back with ``succeeded`` or ``failed``. Each failure doubles the delay up to
+    ``max_delay``; after ``max_attempts`` failures an entry is exhausted and only retried
+    after ``retry_now``. A claim hides the entry from other drainers for ``CLAIM_SECONDS``,
+    so several workers sharing the database never upload the same entry at once.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        base_delay: float = DEFAULT_RETRY_BASE,
+        max_delay: float = DEFAULT_RETRY_MAX_DELAY,
+        max_attempts: int = DEFAULT_RETRY_LIMIT,
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                upload_url TEXT NOT NULL,
+                path TEXT NOT NULL,
+                job_id TEXT,
+                delete_after INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                claimed_until REAL NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                UNIQUE (upload_url, path)
+            )
+            """
+        )
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** max(0, attempts - 1))
+
+    def add(self, upload_url: str, path: str, delete_after: bool, job_id: Optional[str] = None, error: Optional[str] = None):
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                """
+                INSERT INTO uploads (upload_url, path, job_id, delete_after, attempts, next_attempt, last_error, created)
+                VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+                ON CONFLICT (upload_url, path) DO UPDATE SET
+                    job_id = excluded.job_id,
+                    delete_after = excluded.delete_after,
+                    attempts = 0,
+                    next_attempt = excluded.next_attempt,
+                    last_error = excluded.last_error,
+                    claimed_until = 0
+                """,
+                (upload_url, str(path), job_id, int(bool(delete_after)), now + self.backoff(1), error, now),
+            )
+
+    def claim_due(self, limit: int = 50) -> list[dict]:
+        """Claim up to ``limit`` entries whose backoff has expired and that have attempts left."""
+        now = time.time()
+        query = (
+            "SELECT * FROM uploads WHERE claimed_until < ? AND next_attempt <= ? AND attempts < ? "
+            "ORDER BY id LIMIT ?"
+        )
+        params = (now, now, self.max_attempts, limit)
+        claimed = []
+        with self._db_lock:
+            rows = [dict(row) for row in self._conn.execute(query, params).fetchall()]
+            for row in rows:
+                cur = self._conn.execute(
+                    "UPDATE uploads SET claimed_until = ? WHERE id = ? AND claimed_until < ?",
+                    (now + CLAIM_SECONDS, row["id"], now),
+                )
+                if cur.rowcount == 1:
+                    claimed.append(row)
+        return claimed
+
+    def succeeded(self, entry_id: int):
+        with self._db_lock:
+            self._conn.execute("DELETE FROM uploads WHERE id = ?", (entry_id,))
+
+    def failed(self, entry: dict, error: str):
+        attempts = entry["attempts"] + 1
+        with self._db_lock:
+            self._conn.execute(
+                "UPDATE uploads SET attempts = ?, next_attempt = ?, last_error = ?, claimed_until = 0 WHERE id = ?",
+                (attempts, time.time() + self.backoff(attempts + 1), error, entry["id"]),
+            )
+
+    def retry_now(self) -> int:
+        """Make every unclaimed entry due, giving exhausted entries one more attempt."""
+        now = time.time()
+        with self._db_lock:
+            cur = self._conn.execute(
+                "UPDATE uploads SET next_attempt = ?, attempts = MIN(attempts, ?) WHERE claimed_until < ?",
+                (now, self.max_attempts - 1, now),
+            )
+        return cur.rowcount
+
+    def discard(self, entry_id: Optional[int] = None) -> int:
+        with self._db_lock:
+            if entry_id is None:
+                cur = self._conn.execute("DELETE FROM uploads")
+            else:
+                cur = self._conn.execute("DELETE FROM uploads WHERE id = ?", (entry_id,))
+        return cur.rowcount
+
+    def entries(self, limit: int = 100) -> list[dict]:
+        with self._db_lock:
+            rows = self._conn.execute("SELECT * FROM uploads ORDER BY id LIMIT ?", (limit,)).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["delete_after"] = bool(entry["delete_after"])
+            entry["exhausted"] = entry["attempts"] >= self.max_attempts
+            entries.append(entry)
+        return entries
+
+    def counts(self) -> dict:
+        with self._db_lock:
+            total, exhausted = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(attempts >= ?), 0) FROM uploads",
+                (self.max_attempts,),
+            ).fetchone()
+        return {"pending": total - exhausted, "exhausted": exhausted}
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
+
+
+def create_upload_queue(base_dir: Path):
+    backend = os.environ.get("UPLOAD_QUEUE", "none").strip().lower()
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        db_path = os.environ.get("UPLOAD_QUEUE_PATH") or str(base_dir / ".gemini-clean" / "uploads.db")
+        return UploadRetryQueue(
+            Path(db_path),
+            base_delay=float(os.environ.get("UPLOAD_RETRY_BASE", DEFAULT_RETRY_BASE)),
+            max_delay=float(os.environ.get("UPLOAD_RETRY_MAX_DELAY", DEFAULT_RETRY_MAX_DELAY)),
+            max_attempts=int(os.environ.get("UPLOAD_RETRY_LIMIT", DEFAULT_RETRY_LIMIT)),
+        )
+    raise ValueError(f"Unknown UPLOAD_QUEUE backend: {backend}")
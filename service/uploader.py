@@ -1,13 +1,25 @@
 from urllib.parse import urlparse
+from contextlib import ExitStack
+import io
 import logging
 import os
+import threading
 import time
 import requests
 
+from tracing import span
+
 DEFAULT_TIMEOUT = 60
 DEFAULT_RETRIES = 1
+DEFAULT_BATCH_MAX_BYTES = 20 * 1024 * 1024
 LOGGER = logging.getLogger("uploader")
 
+# Upload URLs whose host answered a multipart batch with fewer sources than files,
+# mapped to when to try batching again; until then batches go to single uploads.
+BATCH_UNSUPPORTED: dict[str, float] = {}
+BATCH_UNSUPPORTED_LOCK = threading.Lock()
+BATCH_UNSUPPORTED_TTL = 3600.0
+
 
 def build_full_url(api_url: str, src: str) -> str:
     if src.startswith("http://") or src.startswith("https://"):
@@ -29,18 +41,21 @@ def parse_upload_response(data):
     return None
 
 
-def upload_file(api_url: str, file_path: str, timeout: int = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
+def parse_upload_sources(data):
+    if isinstance(data, dict):
+        data = data.get("data")
+    if not isinstance(data, list):
+        return []
+    return [item.get("src") if isinstance(item, dict) else None for item in data]
+
+
+def send_upload(api_url: str, open_payload, filename: str, file_size, timeout: int, retries: int):
     last_error = None
-    try:
-        file_size = os.path.getsize(file_path)
-    except Exception:
-        file_size = None
-    filename = os.path.basename(file_path)
     for attempt in range(retries + 1):
         try:
             start = time.monotonic()
-            with open(file_path, "rb") as f:
-                resp = requests.post(api_url, files={"file": f}, timeout=timeout)
+            with span("upload", file=filename, attempt=attempt + 1), open_payload() as f:
+                resp = requests.post(api_url, files={"file": (filename, f)}, timeout=timeout)
             duration_ms = int((time.monotonic() - start) * 1000)
             LOGGER.info("upload attempt=%s ok duration_ms=%s size=%s file=%s", attempt + 1, duration_ms, file_size, filename)
             resp.raise_for_status()
@@ -63,6 +78,132 @@ def upload_file(api_url: str, file_path: str, timeout: int = DEFAULT_TIMEOUT, re
     return False, str(last_error) if last_error else "unknown error"
 
 
+def upload_file(api_url: str, file_path: str, timeout: int = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
+    try:
+        file_size = os.path.getsize(file_path)
+    except Exception:
+        file_size = None
+    filename = os.path.basename(file_path)
+    return send_upload(api_url, lambda: open(file_path, "rb"), filename, file_size, timeout, retries)
+
+
+def upload_bytes(api_url: str, data: bytes, filename: str, timeout: int = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
+    return send_upload(api_url, lambda: io.BytesIO(data), filename, len(data), timeout, retries)
+
+
+def batch_items(items, max_count: int, max_bytes: int, size_of):
+    """Group ``items`` into lists of at most ``max_count`` items and about ``max_bytes`` bytes."""
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        size = size_of(item)
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def send_upload_batch(api_url: str, payloads, timeout: int):
+    """POST several files in one multipart request.
+
+    ``payloads`` holds ``(filename, open_payload, size)`` tuples. Returns one entry per
+    payload: ``(True, url)`` if the host stored it, ``(False, error)`` if it is unknown
+    whether the host stored it, or None if it must be sent again as a single upload.
+    """
+    with BATCH_UNSUPPORTED_LOCK:
+        if BATCH_UNSUPPORTED.get(api_url, 0) > time.monotonic():
+            return [None] * len(payloads)
+        BATCH_UNSUPPORTED.pop(api_url, None)
+    total_size = sum(size or 0 for _, _, size in payloads)
+    start = time.monotonic()
+    try:
+        with span("upload_batch", files=len(payloads)), ExitStack() as stack:
+            files = [("file", (filename, stack.enter_context(open_payload()))) for filename, open_payload, _ in payloads]
+            resp = requests.post(api_url, files=files, timeout=timeout)
+    except requests.ConnectTimeout as exc:
+        # Nothing was sent, so single uploads cannot duplicate anything.
+        LOGGER.info("upload batch files=%s failed to connect error=%s", len(payloads), exc)
+        return [None] * len(payloads)
+    except Exception as exc:
+        # The host may have stored the batch before the connection broke; sending the
+        # files again could store them twice, so report them failed instead.
+        duration_ms = int((time.monotonic() - start) * 1000)
+        LOGGER.info("upload batch files=%s failed duration_ms=%s size=%s error=%s", len(payloads), duration_ms, total_size, exc)
+        return [(False, str(exc))] * len(payloads)
+    duration_ms = int((time.monotonic() - start) * 1000)
+    if resp.status_code >= 400:
+        # The host refused the request, e.g. too large or unauthorized; single uploads
+        # report the real per-file outcome without disabling batching.
+        LOGGER.info("upload batch files=%s failed duration_ms=%s status=%s", len(payloads), duration_ms, resp.status_code)
+        return [None] * len(payloads)
+    try:
+        sources = parse_upload_sources(resp.json())
+    except Exception as exc:
+        sources = []
+        LOGGER.info("upload batch files=%s unparsable duration_ms=%s error=%s", len(payloads), duration_ms, exc)
+    results = [
+        (True, build_full_url(api_url, src)) if src else None
+        for src, _ in zip(sources + [None] * len(payloads), payloads)
+    ]
+    missing = results.count(None)
+    if missing:
+        LOGGER.info(
+            "upload batch returned %s of %s sources, sending the rest singly url=%s",
+            len(payloads) - missing,
+            len(payloads),
+            urlparse(api_url).netloc,
+        )
+        with BATCH_UNSUPPORTED_LOCK:
+            BATCH_UNSUPPORTED[api_url] = time.monotonic() + BATCH_UNSUPPORTED_TTL
+    else:
+        LOGGER.info("upload batch files=%s ok duration_ms=%s size=%s", len(payloads), duration_ms, total_size)
+    return results
+
+
+def upload_files(api_url: str, file_paths, timeout: int = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
+    """Upload ``file_paths`` in one request; files the batch did not store are sent singly."""
+    payloads = []
+    for file_path in file_paths:
+        try:
+            file_size = os.path.getsize(file_path)
+        except Exception:
+            file_size = None
+        payloads.append((os.path.basename(file_path), lambda p=file_path: open(p, "rb"), file_size))
+    results = send_upload_batch(api_url, payloads, timeout) if len(payloads) > 1 else [None] * len(payloads)
+    return [
+        result or upload_file(api_url, file_path, timeout, retries)
+        for file_path, result in zip(file_paths, results)
+    ]
+
+
+def upload_buffers(api_url: str, buffers, timeout: int = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
+    """Upload ``(filename, data)`` pairs in one request; buffers the batch did not store are sent singly."""
+    payloads = [(filename, lambda d=data: io.BytesIO(d), len(data)) for filename, data in buffers]
+    results = send_upload_batch(api_url, payloads, timeout) if len(payloads) > 1 else [None] * len(payloads)
+    return [
+        result or upload_bytes(api_url, data, filename, timeout, retries)
+        for (filename, data), result in zip(buffers, results)
+    ]
+
+
+def handle_upload_batch(api_url: str, file_paths, delete_after: bool):
+    results = []
+    for file_path, (ok, result) in zip(file_paths, upload_files(api_url, file_paths)):
+        deleted = False
+        if ok and delete_after:
+            try:
+                os.remove(file_path)
+                deleted = True
+            except Exception:
+                deleted = False
+        results.append((ok, result, deleted))
+    return results
+
+
 def handle_upload(api_url: str, file_path: str, delete_after: bool):
     ok, result = upload_file(api_url, file_path)
     deleted = False
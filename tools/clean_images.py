@@ -3,13 +3,30 @@
 
 Usage:
   python3 tools/clean_images.py --input ~/Downloads/Gemini-Originals --output ~/Downloads/Gemini-Clean
+
+Stream a zip/tar archive through the local service and save the cleaned archive:
+  python3 tools/clean_images.py --archive batch.tar --output cleaned.tar
+  cat batch.zip | python3 tools/clean_images.py --archive - --output - --format zip > cleaned.zip
+
+Profile a local run (open the .pstats file with `python3 -m pstats`, snakeviz or flameprof):
+  python3 tools/clean_images.py --input in --output out --profile clean.pstats
 """
 
 import argparse
+import cProfile
+import http.client
 import os
+import pstats
+import shutil
+import sys
+import threading
 from pathlib import Path
+from urllib.parse import urlencode, urlparse
 from PIL import Image
 
+DEFAULT_SERVICE_URL = "http://127.0.0.1:17811"
+STREAM_CHUNK_SIZE = 256 * 1024
+
 ALPHA_THRESHOLD = 0.002
 MAX_ALPHA = 0.99
 LOGO_VALUE = 255
@@ -95,14 +112,54 @@ def iter_images(input_dir):
             yield entry
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Remove Gemini visible watermark from images")
-    parser.add_argument("--input", required=True, help="Input directory containing downloaded images")
-    parser.add_argument("--output", required=True, help="Output directory for cleaned images")
-    args = parser.parse_args()
-
-    input_dir = Path(os.path.expanduser(args.input)).resolve()
-    output_dir = Path(os.path.expanduser(args.output)).resolve()
+def open_stream(path, mode):
+    if path == "-":
+        return sys.stdin.buffer if "r" in mode else sys.stdout.buffer
+    return open(os.path.expanduser(path), mode)
+
+
+def clean_archive(service_url, archive_path, output_path, output_format):
+    """Send an archive to the service's /clean/archive endpoint and save the cleaned archive.
+
+    The request body is sent from a separate thread while the response is read, so both
+    directions stream and neither archive is held in memory.
+    """
+    parsed = urlparse(service_url)
+    conn_cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+    conn = conn_cls(parsed.netloc)
+    path = parsed.path.rstrip("/") + "/clean/archive?" + urlencode({"output_format": output_format})
+    conn.putrequest("POST", path)
+    conn.putheader("Content-Type", "application/octet-stream")
+    conn.putheader("Transfer-Encoding", "chunked")
+    conn.endheaders()
+
+    send_error = []
+
+    def send_body():
+        try:
+            with open_stream(archive_path, "rb") as src:
+                for chunk in iter(lambda: src.read(STREAM_CHUNK_SIZE), b""):
+                    conn.send(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            conn.send(b"0\r\n\r\n")
+        except Exception as exc:
+            send_error.append(exc)
+
+    sender = threading.Thread(target=send_body, daemon=True)
+    sender.start()
+    resp = conn.getresponse()
+    if resp.status != 200:
+        raise SystemExit(f"Service error: HTTP {resp.status} {resp.read().decode(errors='replace')}")
+    with open_stream(output_path, "wb") as dst:
+        shutil.copyfileobj(resp, dst, STREAM_CHUNK_SIZE)
+    sender.join()
+    conn.close()
+    if send_error:
+        raise SystemExit(f"Upload failed: {send_error[0]}")
+
+
+def clean_directory(input_path, output_path):
+    input_dir = Path(os.path.expanduser(input_path)).resolve()
+    output_dir = Path(os.path.expanduser(output_path)).resolve()
 
     if not input_dir.exists() or not input_dir.is_dir():
         raise SystemExit(f"Input directory not found: {input_dir}")
@@ -128,5 +185,37 @@ def main():
     print(f"Done. total={total} success={success} failed={failures}")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Remove Gemini visible watermark from images")
+    parser.add_argument("--input", help="Input directory containing downloaded images")
+    parser.add_argument("--output", required=True, help="Output directory for cleaned images (archive file or - with --archive)")
+    parser.add_argument("--archive", help="Zip/tar archive (or - for stdin) to stream through the local service")
+    parser.add_argument("--service", default=DEFAULT_SERVICE_URL, help="Service URL used with --archive")
+    parser.add_argument("--format", choices=["tar", "zip"], default="tar", help="Output archive format used with --archive")
+    parser.add_argument("--profile", help="Run under cProfile, save the stats to this file and print the top functions")
+    args = parser.parse_args()
+
+    if args.archive:
+        if args.profile:
+            parser.error("--profile is not supported with --archive; start a service job with \"profile\": true instead")
+        clean_archive(args.service, args.archive, args.output, args.format)
+        return
+    if not args.input:
+        parser.error("--input is required unless --archive is given")
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            clean_directory(args.input, args.output)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            stats = pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative")
+            stats.print_stats(25)
+        return
+    clean_directory(args.input, args.output)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""Load-test the local cleaning service end to end.
+
+Starts the service with uvicorn against a temporary BASE_DIR seeded with synthetic
+images, plus a stub image host for uploads. Client threads then send a weighted mix
+of /clean/start, /clean/status and /upload-test requests for a fixed duration. The
+report lists p50/p95/p99 latency and throughput per endpoint, and the service's peak
+thread count and memory.
+
+Usage:
+  python3 tools/load_test.py --clients 16 --duration 30
+  python3 tools/load_test.py --clients 32 --mix clean=1,status=20,upload=2 --upload --drain 300
+  python3 tools/load_test.py --clients 32 --workers 4 --job-store sqlite --json report.json
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from PIL import Image
+
+SERVICE_DIR = Path(__file__).resolve().parents[1] / "service"
+OPERATIONS = ("clean", "status", "upload")
+DEFAULT_MIX = "clean=1,status=10,upload=1"
+STARTUP_TIMEOUT = 30
+REQUEST_TIMEOUT = 120
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}; use {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight for {name}: {weight!r}")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("at least one operation needs a positive weight")
+    return mix
+
+
+def seed_images(input_dir: Path, count: int, size: int):
+    """Write ``count`` noisy PNGs so encoding costs about as much as real photos."""
+    input_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        img = Image.effect_noise((size, size), 64).convert("RGBA")
+        img.save(input_dir / f"load_{i:04d}.png", format="PNG")
+
+
+class StubUploadHandler(BaseHTTPRequestHandler):
+    """Accepts single and batched multipart uploads like the image host and returns one src per file."""
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        names = re.findall(rb'filename="([^"]*)"', body)
+        if self.delay:
+            time.sleep(self.delay)
+        data = json.dumps([{"src": f"/file/{name.decode(errors='replace')}"} for name in names] or [{"src": "/file/empty"}])
+        payload = data.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubUploadServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The uploader does not reuse connections; resets on close are expected.
+        pass
+
+
+def start_stub_upload_server(delay: float):
+    handler = type("StubUpload", (StubUploadHandler,), {"delay": delay})
+    server = StubUploadServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/upload"
+
+
+def start_service(base_dir: Path, port: int, workers: int, job_store: str):
+    env = dict(os.environ, BASE_DIR=str(base_dir), JOB_STORE=job_store, PYTHONUNBUFFERED="1")
+    log = open(base_dir / "service.log", "wb")
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    proc = subprocess.Popen(cmd, cwd=SERVICE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Service exited during startup, see {base_dir / 'service.log'}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("Service did not become healthy in time")
+
+
+def process_tree(pid: int) -> list[int]:
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def sample_process(pid: int):
+    """Return ``(threads, rss_bytes)`` summed over the service process and its workers."""
+    threads = rss = 0
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/status") as f:
+                for line in f:
+                    if line.startswith("Threads:"):
+                        threads += int(line.split()[1])
+                    elif line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return threads, rss
+
+
+class ResourceMonitor:
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.max_threads = 0
+        self.max_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if os.path.isdir("/proc"):
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            threads, rss = sample_process(self.pid)
+            self.max_threads = max(self.max_threads, threads)
+            self.max_rss = max(self.max_rss, rss)
+            self._stop.wait(self.interval)
+
+
+class LoadClient:
+    """One simulated extension client with its own keep-alive connection."""
+
+    def __init__(self, index: int, args, upload_url: str, results: dict, jobs: list, lock: threading.Lock):
+        self.index = index
+        self.args = args
+        self.upload_url = upload_url
+        self.results = results
+        self.jobs = jobs
+        self.lock = lock
+        self.conn = None
+        self.rng = random.Random(args.seed + index)
+
+    def request(self, method: str, path: str, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.args.port, timeout=REQUEST_TIMEOUT)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                resp = self.conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def record(self, operation: str, latency: float, ok: bool):
+        with self.lock:
+            entry = self.results[operation]
+            entry["latencies"].append(latency)
+            if not ok:
+                entry["errors"] += 1
+
+    def run_operation(self, operation: str):
+        if operation == "clean":
+            body = {"input_subdir": "Input", "output_subdir": f"Output-{self.index}", "priority": "bulk"}
+            if self.args.upload:
+                body.update(upload_enabled=True, upload_url=self.upload_url, delete_cleaned=True)
+            start = time.perf_counter()
+            status, data = self.request("POST", "/clean/start", body)
+            self.record("clean", time.perf_counter() - start, status == 200)
+            if status == 200:
+                with self.lock:
+                    self.jobs.append(json.loads(data)["job_id"])
+        elif operation == "status":
+            with self.lock:
+                job_id = self.rng.choice(self.jobs) if self.jobs else None
+            if job_id is None:
+                return False
+            start = time.perf_counter()
+            status, _ = self.request("GET", f"/clean/status?job_id={job_id}")
+            self.record("status", time.perf_counter() - start, status == 200)
+        else:
+            start = time.perf_counter()
+            status, _ = self.request("POST", "/upload-test", {"upload_url": self.upload_url})
+            self.record("upload", time.perf_counter() - start, status == 200)
+        return True
+
+    def run(self, deadline: float):
+        operations = list(self.args.mix)
+        weights = [self.args.mix[name] for name in operations]
+        while time.monotonic() < deadline:
+            operation = self.rng.choices(operations, weights)[0]
+            start = time.perf_counter()
+            try:
+                if not self.run_operation(operation):
+                    operation = "clean"
+                    start = time.perf_counter()
+                    self.run_operation(operation)
+            except Exception:
+                # A failed request still took this long; recording 0 would hide overload.
+                self.record(operation, time.perf_counter() - start, False)
+            if self.args.think:
+                time.sleep(self.rng.uniform(0, 2 * self.args.think))
+        if self.conn:
+            self.conn.close()
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest rank: the smallest value with at least pct% of the values at or below it.
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[rank]
+
+
+def summarize(results: dict, elapsed: float) -> dict:
+    summary = {}
+    for operation, entry in results.items():
+        latencies = sorted(entry["latencies"])
+        if not latencies:
+            continue
+        summary[operation] = {
+            "requests": len(latencies),
+            "errors": entry["errors"],
+            "throughput": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+    return summary
+
+
+def collect_jobs(port: int, job_ids: list[str]) -> dict:
+    totals = {"jobs": len(job_ids), "finished": 0, "cleaned": 0, "failed": 0, "uploaded": 0}
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=REQUEST_TIMEOUT)
+    try:
+        for job_id in job_ids:
+            conn.request("GET", f"/clean/status?job_id={job_id}")
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status != 200:
+                continue
+            job = json.loads(data)
+            totals["finished"] += int(job["done"])
+            totals["cleaned"] += job["success"]
+            totals["failed"] += job["failed"]
+            totals["uploaded"] += job["upload_success"]
+    finally:
+        conn.close()
+    return totals
+
+
+def drain_jobs(port: int, job_ids: list[str], timeout: float) -> dict:
+    """Wait until every started job is done (or ``timeout`` passes) and return the final totals."""
+    deadline = time.monotonic() + timeout
+    while True:
+        totals = collect_jobs(port, job_ids)
+        if totals["finished"] == totals["jobs"] or time.monotonic() >= deadline:
+            return totals
+        time.sleep(1)
+
+
+def print_report(args, summary: dict, jobs: dict, monitor: ResourceMonitor, elapsed: float, total_elapsed: float):
+    total_requests = sum(item["requests"] for item in summary.values())
+    print(f"clients={args.clients} duration={elapsed:.1f}s workers={args.workers} job_store={args.job_store} "
+          f"images={args.images}x{args.image_size}px upload={'on' if args.upload else 'off'}")
+    print(f"{'endpoint':<8} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for operation, item in summary.items():
+        print(f"{operation:<8} {item['requests']:>8} {item['errors']:>6} {item['throughput']:>8.2f} "
+              f"{item['p50_ms']:>9.2f} {item['p95_ms']:>9.2f} {item['p99_ms']:>9.2f} {item['max_ms']:>9.2f}")
+    print(f"total    {total_requests:>8} {'':>6} {total_requests / elapsed:>8.2f}")
+    print(f"jobs started={jobs['jobs']} finished={jobs['finished']} images cleaned={jobs['cleaned']} "
+          f"({jobs['cleaned'] / total_elapsed:.2f}/s over {total_elapsed:.1f}s) failed={jobs['failed']} "
+          f"uploaded={jobs['uploaded']}")
+    if monitor.max_threads:
+        print(f"service peak threads={monitor.max_threads} peak rss={monitor.max_rss / (1024 * 1024):.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the local cleaning service")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent simulated clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to send requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Operation weights, e.g. {DEFAULT_MIX}")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean pause between a client's requests in seconds")
+    parser.add_argument("--images", type=int, default=20, help="Synthetic images in the input folder")
+    parser.add_argument("--image-size", type=int, default=1200, help="Side length of the synthetic images")
+    parser.add_argument("--upload", action="store_true", help="Upload cleaned files to the stub host in clean jobs")
+    parser.add_argument("--upload-delay", type=float, default=0.0, help="Seconds the stub host waits before answering")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--job-store", choices=["memory", "sqlite"], default="memory",
+                        help="JOB_STORE backend (use sqlite with --workers > 1)")
+    parser.add_argument("--drain", type=float, default=0.0,
+                        help="After the load phase, wait up to this many seconds for started jobs to finish")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the request mix")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary BASE_DIR for inspection")
+    args = parser.parse_args()
+    if args.workers > 1 and args.job_store == "memory":
+        parser.error("--workers > 1 needs --job-store sqlite, otherwise status requests miss jobs of other workers")
+
+    base_dir = Path(tempfile.mkdtemp(prefix="gemini-clean-load-"))
+    stub_server, upload_url = start_stub_upload_server(args.upload_delay)
+    proc = None
+    try:
+        print(f"seeding {args.images} images in {base_dir}", file=sys.stderr)
+        seed_images(base_dir / "Input", args.images, args.image_size)
+        args.port = free_port()
+        proc = start_service(base_dir, args.port, args.workers, args.job_store)
+        monitor = ResourceMonitor(proc.pid)
+        monitor.start()
+
+        results = {name: {"latencies": [], "errors": 0} for name in OPERATIONS}
+        jobs: list[str] = []
+        lock = threading.Lock()
+        clients = [LoadClient(i, args, upload_url, results, jobs, lock) for i in range(args.clients)]
+        start = time.monotonic()
+        deadline = start + args.duration
+        threads = [threading.Thread(target=client.run, args=(deadline,), daemon=True) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        if args.drain:
+            job_totals = drain_jobs(args.port, jobs, args.drain)
+        else:
+            job_totals = collect_jobs(args.port, jobs)
+        total_elapsed = time.monotonic() - start
+        monitor.stop()
+
+        summary = summarize(results, elapsed)
+        print_report(args, summary, job_totals, monitor, elapsed, total_elapsed)
+        if args.json:
+            report = {
+                "config": {key: value for key, value in vars(args).items() if key not in ("json", "keep")},
+                "elapsed": round(elapsed, 3),
+                "total_elapsed": round(total_elapsed, 3),
+                "endpoints": summary,
+                "jobs": job_totals,
+                "service": {"peak_threads": monitor.max_threads, "peak_rss": monitor.max_rss},
+            }
+            Path(args.json).write_text(json.dumps(report, indent=2))
+    finally:
+        if proc:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        stub_server.shutdown()
+        if args.keep:
+            print(f"kept {base_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()